@@ -0,0 +1,469 @@
+# The multi-layer greenhouse atmosphere: stepping a column, solving for equilibrium, ensembles.
+import numpy as np
+import warnings
+import profiling
+import kernels
+import hashlib
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# define a bunch of constants we'll use later
+sb_const = 5.670367e-8 #W⋅m -2
+sp_heat_capacity_water = 4.2e3 # J/kg/Kelvin
+density_water = 1000 # kg/m^3
+sp_heat_capacity_air = 1005 # J/kg/Kelvin
+gravity = 9.81 # ms^-2
+
+def calc_transmission(emissivity):
+    # how much of the radiation leaving one level makes it to another level.
+    # each layer lets through (1 - emissivity) of what reaches it, so these are
+    # cumulative products of (1 - emissivity) through the layers in between.
+    # emissivity can have leading (ensemble) dimensions; layers are the last axis.
+    n_layers = emissivity.shape[-1]
+    transmit = 1. - emissivity
+    ones = np.ones(emissivity.shape[:-1] + (1,), dtype=emissivity.dtype)
+    lev = np.arange(n_layers+1)[:, np.newaxis] # levels: 0 is the surface, n_layers is space
+    lay = np.arange(n_layers)[np.newaxis, :]
+
+    # surface emission reaching level k passes through layers 0..k-1
+    surf_up = np.concatenate((ones, np.cumprod(transmit, axis=-1)), axis=-1)
+    # emission from layer i reaching level k above it passes through layers i+1..k-1
+    below_lev = np.concatenate((ones, transmit), axis=-1)[..., np.newaxis]
+    trans_up = np.cumprod(np.where(lev > lay+1, below_lev, 1.), axis=-2) * (lev > lay)
+    # emission from layer i reaching level k below it passes through layers k..i-1
+    above_lev = np.concatenate((transmit, ones), axis=-1)[..., np.newaxis]
+    trans_dn = np.flip(np.cumprod(np.flip(np.where(lev < lay, above_lev, 1.), axis=-2), axis=-2), axis=-2) * (lev <= lay)
+    return surf_up, trans_up, trans_dn
+
+def calc_fluxes(t_surf, t_atm, emissivity, transmission):
+    # upward and downward infrared at every level, all layers at once
+    surf_up, trans_up, trans_dn = transmission
+    emit = (sb_const*emissivity*t_atm**4.)[..., np.newaxis]
+    heat_upward = surf_up*sb_const*np.asarray(t_surf)[..., np.newaxis]**4. + (trans_up @ emit)[..., 0]
+    heat_dnward = (trans_dn @ emit)[..., 0] # ignore downward infrared from space
+    return heat_upward, heat_dnward
+
+def calc_heating(heat_from_the_sun, heat_upward, heat_dnward):
+    # net heating (W/m^2) of the surface and of each layer
+    surf_heating = heat_from_the_sun + heat_dnward[..., 0] - heat_upward[..., 0]
+    atm_heating = heat_upward[..., :-1]-heat_upward[..., 1:]+heat_dnward[..., 1:]-heat_dnward[..., :-1]
+    return surf_heating, atm_heating
+
+def calc_balance_matrix(emissivity, transmission):
+    # every flux is linear in sigma*T^4 of the surface and of each layer, so the
+    # net heating is matrix @ [sigma*Ts^4, sigma*T0^4, ...] plus the sunlight
+    # absorbed at the surface
+    surf_up, trans_up, trans_dn = transmission
+    n_layers = emissivity.shape[-1]
+    matrix = np.zeros(emissivity.shape[:-1] + (n_layers+1, n_layers+1), dtype=emissivity.dtype)
+    matrix[..., 0, 0] = -1.
+    matrix[..., 0, 1:] = trans_dn[..., 0, :]*emissivity
+    matrix[..., 1:, 0] = surf_up[..., :-1]-surf_up[..., 1:]
+    matrix[..., 1:, 1:] = (trans_up[..., :-1, :]-trans_up[..., 1:, :]
+                           +trans_dn[..., 1:, :]-trans_dn[..., :-1, :])*emissivity[..., np.newaxis, :]
+    return matrix
+
+# what the model hands back: temperatures, fluxes, and how well it settled down
+AtmosResult = namedtuple('AtmosResult', ['t_surf', 't_atm', 'heat_upward', 'heat_dnward',
+                                         'iterations', 'residual', 'converged'])
+# run_atmos_ensemble's answer: the same, plus the most memory it needed per member
+# (bytes, leaving out the few kB that don't grow with the ensemble)
+AtmosEnsemble = namedtuple('AtmosEnsemble', AtmosResult._fields + ('bytes_per_member',))
+
+def calc_heat_capacity(n_layers):
+    # ground heat capacity; assume 1-meter mixed layer depth
+    heat_capacity_ground = sp_heat_capacity_water * density_water
+
+    # atmosphere heat capacity; divide the 1000 hPa of atmosphere evenly into n_layers chunks
+    heat_capacity_atm = None
+    if n_layers >= 1:
+        heat_capacity_atm = 100000./n_layers*gravity*sp_heat_capacity_air
+    return heat_capacity_ground, heat_capacity_atm
+
+class AtmosWorkspace:
+    # every array a column run needs, made once. hand the same workspace to
+    # integrate_atmos_model (or step_atmos_column) run after run and the time stepping
+    # allocates nothing. the t_atm, heat_upward and heat_dnward it hands back are the
+    # workspace's own arrays, so copy anything you want to keep before the next run.
+    def __init__(self, n_layers):
+        self.n_layers = n_layers
+        self.t_atm = np.zeros(n_layers)
+        self.emissivity = np.zeros(n_layers)
+        self.emiss_atm = None # what transmission was last worked out for
+        self.transmission = None
+        # scratch for step_atmos_column; the emission and fluxes are columns so the
+        # products come out exactly as calc_fluxes' do
+        self.emit_factor = np.zeros(n_layers)
+        self.surf_factor = np.zeros(n_layers+1)
+        self.surf_emit = np.zeros(1)
+        self.emit = np.zeros((n_layers, 1))
+        self.upward = np.zeros((n_layers+1, 1))
+        self.from_layers = np.zeros((n_layers+1, 1))
+        self.dnward = np.zeros((n_layers+1, 1))
+        self.atm_heating = np.zeros(n_layers)
+        self.dt_atm = np.zeros(n_layers)
+
+    def set_emissivity(self, emiss_atm):
+        # the same emissivity in every layer; transmission is only redone if it changed
+        if emiss_atm != self.emiss_atm:
+            self.emissivity[:] = emiss_atm
+            self.transmission = calc_transmission(self.emissivity)
+            self.emiss_atm = emiss_atm
+        return self.emissivity, self.transmission
+
+def step_atmos_column(t_surf, t_atm, emissivity, transmission, heat_from_the_sun, n_steps, tol=None, workspace=None):
+    # the time stepping on its own, starting from whatever temperatures it's given, so
+    # a column that's already near equilibrium can be nudged along instead of spun up
+    # from scratch. t_atm is updated in place. stops early once the top-of-atmosphere
+    # imbalance (W/m^2) and the largest one-step temperature change (K) are both under
+    # tol. returns t_surf, heat_upward, heat_dnward, steps taken and whether it settled.
+    # the loop works in workspace's arrays (an AtmosWorkspace; a new one if not given),
+    # with the same arithmetic as calc_fluxes and calc_heating.
+    n_layers = len(t_atm)
+    n_seconds = 60.*60.*24. # one-day timestep
+    heat_capacity_ground, heat_capacity_atm = calc_heat_capacity(n_layers)
+    if kernels.use_jit() and n_steps > 0:
+        t_surf, heat_upward, heat_dnward, n_taken, converged = kernels.atmos_column_steps(
+            float(t_surf), t_atm, np.ascontiguousarray(emissivity, dtype=float), *transmission, heat_from_the_sun,
+            sb_const, heat_capacity_ground, heat_capacity_atm or 1., n_seconds, n_steps, -1. if tol is None else tol)
+        profiling.count('atmos.steps', n_taken)
+        return t_surf, heat_upward, heat_dnward, n_taken, converged
+
+    if workspace is None:
+        workspace = AtmosWorkspace(n_layers)
+    surf_up, trans_up, trans_dn = transmission
+    emit_factor, surf_factor = workspace.emit_factor, workspace.surf_factor
+    emit, upward, from_layers, dnward = workspace.emit, workspace.upward, workspace.from_layers, workspace.dnward
+    atm_heating, dt_atm, surf_emit = workspace.atm_heating, workspace.dt_atm, workspace.surf_emit
+    heat_upward, heat_dnward = upward[:, 0], dnward[:, 0]
+    np.multiply(sb_const, emissivity, out=emit_factor)
+    np.multiply(surf_up, sb_const, out=surf_factor)
+
+    n_taken = 0
+    converged = False
+    for jj in range(n_steps):
+        # calc_fluxes
+        np.power(t_atm, 4., out=emit[:, 0])
+        np.multiply(emit_factor, emit[:, 0], out=emit[:, 0])
+        surf_emit[0] = t_surf
+        np.power(surf_emit, 4., out=surf_emit)
+        np.multiply(surf_factor, surf_emit, out=heat_upward)
+        np.matmul(trans_up, emit, out=from_layers)
+        np.add(upward, from_layers, out=upward)
+        np.matmul(trans_dn, emit, out=dnward)
+        # calc_heating, then the temperature changes it causes
+        surf_heating = heat_from_the_sun + heat_dnward[0] - heat_upward[0]
+        dt_surf = surf_heating / heat_capacity_ground * n_seconds
+        t_surf += dt_surf
+        dt_max = abs(dt_surf)
+        if n_layers >= 1:
+            np.subtract(heat_upward[:-1], heat_upward[1:], out=atm_heating)
+            np.add(atm_heating, heat_dnward[1:], out=atm_heating)
+            np.subtract(atm_heating, heat_dnward[:-1], out=atm_heating)
+            np.divide(atm_heating, heat_capacity_atm, out=dt_atm)
+            np.multiply(dt_atm, n_seconds, out=dt_atm)
+            np.add(t_atm, dt_atm, out=t_atm)
+            np.abs(dt_atm, out=dt_atm)
+            dt_max = max(dt_max, dt_atm.max())
+        n_taken = jj+1
+
+        if tol is not None and abs(heat_from_the_sun - heat_upward[-1]) < tol and dt_max < tol:
+            converged = True
+            break
+    if n_taken == 0:
+        # nothing stepped: the fluxes of the starting temperatures
+        heat_upward, heat_dnward = calc_fluxes(t_surf, t_atm, emissivity, transmission)
+    profiling.count('atmos.steps', n_taken)
+    return t_surf, heat_upward, heat_dnward, n_taken, converged
+
+def implicit_atmos_step(t_surf, t_atm, emissivity, transmission, heat_from_the_sun, n_seconds):
+    # one long backward-Euler step of n_seconds (e.g. a year) in a single linear solve:
+    # the heating is linear in sigma*T^4, and sigma*T^4 is linearised about the
+    # current temperatures. stable for any step length, and it ends up at the same
+    # equilibrium as solve_atmos_model. returns the new t_surf and t_atm.
+    n_layers = len(t_atm)
+    heat_capacity_ground, heat_capacity_atm = calc_heat_capacity(n_layers)
+    t_all = np.insert(t_atm, 0, t_surf)
+    capacity = np.full(n_layers+1, heat_capacity_atm if n_layers >= 1 else 0.)
+    capacity[0] = heat_capacity_ground
+    matrix = calc_balance_matrix(emissivity, transmission)
+    heating = matrix @ (sb_const*t_all**4)
+    heating[0] += heat_from_the_sun
+    # d(sigma*T^4)/dT
+    slope = 4.*sb_const*t_all**3
+    dt_all = np.linalg.solve(np.diag(capacity/n_seconds) - matrix*slope, heating)
+    t_all += dt_all
+    return t_all[0], t_all[1:]
+
+def integrate_atmos_model(albedo=0.3, solar_constant = 1.36e3/4., emiss_atm = 0.2, n_layers = 10,
+                          n_steps=40000, tol=None, workspace=None):
+    # step the column forward one day at a time. with tol=None this always takes
+    # n_steps steps; otherwise it stops once the top-of-atmosphere imbalance (W/m^2)
+    # and the largest temperature change in one step (K) both drop below tol.
+    # pass an AtmosWorkspace(n_layers) to reuse its arrays instead of making new ones
+    # (the result then lives in the workspace: see AtmosWorkspace).
+    t_surf = 273.15 # Kelvins; initial temperature only
+
+    if workspace is None:
+        workspace = AtmosWorkspace(n_layers)
+    elif workspace.n_layers != n_layers:
+        raise ValueError('workspace is for {} layers, not {}'.format(workspace.n_layers, n_layers))
+    emissivity, transmission = workspace.set_emissivity(emiss_atm)
+    t_atm = workspace.t_atm
+    t_atm[:] = 273.15
+
+    #heat from the sun
+    sun_reflected = solar_constant*albedo
+    heat_from_the_sun = solar_constant - sun_reflected
+    
+    t_surf, heat_upward, heat_dnward, n_taken, converged = step_atmos_column(
+        t_surf, t_atm, emissivity, transmission, heat_from_the_sun, n_steps, tol, workspace)
+    residual = abs(heat_from_the_sun - heat_upward[-1])
+    if tol is None:
+        converged = bool(np.isfinite(t_surf))
+    elif not converged:
+        warnings.warn('atmosphere did not converge in {} steps (TOA imbalance {:.3g} W/m^2)'.format(n_steps, residual))
+    return AtmosResult(t_surf, t_atm, heat_upward, heat_dnward, n_taken, residual, converged)
+
+def solve_atmos_model(albedo=0.3, solar_constant = 1.36e3/4., emiss_atm = 0.2, n_layers = 10, tol=1e-6):
+    # jump straight to equilibrium: setting all the net heating rates to zero is
+    # one linear system in sigma*T^4 with n_layers+1 unknowns.
+    emissivity = np.zeros(n_layers) + emiss_atm
+    surf_up, trans_up, trans_dn = calc_transmission(emissivity)
+    sun_reflected = solar_constant*albedo
+    heat_from_the_sun = solar_constant - sun_reflected
+
+    matrix = calc_balance_matrix(emissivity, (surf_up, trans_up, trans_dn))
+    forcing = np.zeros(n_layers+1)
+    forcing[0] = heat_from_the_sun
+
+    profiling.count('atmos.solves')
+    try:
+        sigma_t4 = np.linalg.solve(matrix, -forcing)
+    except np.linalg.LinAlgError:
+        sigma_t4 = np.full(n_layers+1, np.nan)
+    with np.errstate(invalid='ignore'):
+        t_all = (sigma_t4/sb_const)**0.25
+    t_surf, t_atm = t_all[0], t_all[1:]
+
+    heat_upward, heat_dnward = calc_fluxes(t_surf, t_atm, emissivity, (surf_up, trans_up, trans_dn))
+    surf_heating, atm_heating = calc_heating(heat_from_the_sun, heat_upward, heat_dnward)
+    residual = max(abs(heat_from_the_sun - heat_upward[-1]), abs(surf_heating), np.max(np.abs(atm_heating), initial=0.))
+    converged = bool(np.all(sigma_t4 > 0) and residual < tol)
+    if not converged:
+        warnings.warn('no radiative equilibrium found (residual {:.3g} W/m^2)'.format(residual))
+    return AtmosResult(t_surf, t_atm, heat_upward, heat_dnward, 1, residual, converged)
+
+def calc_padded_balance(emiss_atm, in_column):
+    # emissivity, transmission and balance matrix for a batch of columns padded out to
+    # the same number of layers (in_column is False for the padding layers)
+    emissivity = np.where(in_column, emiss_atm[:, np.newaxis], 0.)
+    transmission = calc_transmission(emissivity)
+    matrix = calc_balance_matrix(emissivity, transmission)
+    # padding layers have nothing to balance, so pin their sigma*T^4 at zero
+    matrix[:, 1:][~in_column] = 0.
+    pad_member, pad_layer = np.nonzero(~in_column)
+    matrix[pad_member, pad_layer+1, pad_layer+1] = 1.
+    return emissivity, transmission, matrix
+
+# float32 columns only balance to a few hundredths of a W/m^2, so the default tol for
+# calling an ensemble's column converged depends on the dtype
+ensemble_tol = dict(float64=1e-6, float32=0.1) # W/m^2
+# how far float32 ensembles may be from float64, relative to each value (the README
+# has the measured errors)
+float32_rtol = dict(t_surf=2e-5, t_atm=2e-5, heat_upward=1e-4, heat_dnward=1e-4)
+
+def run_atmos_ensemble(albedo=0.3, solar_constant = 1.36e3/4., emiss_atm = 0.2, n_layers = 10, tol=None, dtype=float):
+    # solve many columns for equilibrium at once. the parameters can be arrays and are
+    # broadcast against each other (use np.meshgrid for a full grid). members with fewer
+    # layers than the largest one are padded with see-through layers, and the padded
+    # entries of t_atm, heat_upward and heat_dnward come back as nan. dtype is float
+    # (float64) or np.float32; tol defaults to ensemble_tol for the dtype.
+    albedo, solar_constant, emiss_atm, n_layers = np.broadcast_arrays(albedo, solar_constant, emiss_atm, n_layers)
+    shape = albedo.shape
+    albedo, solar_constant, emiss_atm = [np.ravel(x).astype(dtype) for x in (albedo, solar_constant, emiss_atm)]
+    n_layers = np.ravel(n_layers).astype(int)
+    n_members = n_layers.size
+    if tol is None:
+        tol = ensemble_tol[np.dtype(dtype).name]
+    n_max = n_layers.max(initial=0)
+
+    in_column = np.arange(n_max) < n_layers[:, np.newaxis]
+    on_level = np.arange(n_max+1) <= n_layers[:, np.newaxis]
+    emissivity, transmission, matrix = calc_padded_balance(emiss_atm, in_column)
+    sun_reflected = solar_constant*albedo
+    heat_from_the_sun = solar_constant - sun_reflected
+
+    forcing = np.zeros((n_members, n_max+1), dtype=dtype)
+    forcing[:, 0] = heat_from_the_sun
+
+    profiling.count('atmos.solves', n_members)
+    try:
+        sigma_t4 = np.linalg.solve(matrix, -forcing[..., np.newaxis])[..., 0]
+    except np.linalg.LinAlgError:
+        # at least one member has no solution; do them one by one to find out which
+        sigma_t4 = np.full((n_members, n_max+1), np.nan, dtype=dtype)
+        for mm in range(n_members):
+            try:
+                sigma_t4[mm] = np.linalg.solve(matrix[mm], -forcing[mm])
+            except np.linalg.LinAlgError:
+                pass
+    with np.errstate(invalid='ignore'):
+        t_all = (sigma_t4/sb_const)**0.25
+    t_surf, t_atm = t_all[:, 0], t_all[:, 1:]
+
+    heat_upward, heat_dnward = calc_fluxes(t_surf, t_atm, emissivity, transmission)
+    surf_heating, atm_heating = calc_heating(heat_from_the_sun, heat_upward, heat_dnward)
+    toa_up = np.take_along_axis(heat_upward, n_layers[:, np.newaxis], axis=1)[:, 0]
+    residual = np.maximum(np.abs(heat_from_the_sun - toa_up), np.abs(surf_heating))
+    residual = np.maximum(residual, np.max(np.abs(np.where(in_column, atm_heating, 0.)), axis=1, initial=0.))
+    with np.errstate(invalid='ignore'):
+        converged = np.all((sigma_t4 > 0) | np.insert(~in_column, 0, False, axis=1), axis=1) & (residual < tol)
+    if not np.all(converged):
+        warnings.warn('{} of {} columns found no radiative equilibrium'.format(np.sum(~converged), n_members))
+
+    # the inputs, the transmissions and the matrix stay to the end. on top of those the
+    # peak is the two temporaries the matrix is put together from, the copy of it that
+    # np.linalg.solve works on (float64 whatever the dtype), or the dozen vectors of
+    # levels worked out after the solve, whichever is biggest
+    inputs = 3*albedo.nbytes + n_layers.nbytes + in_column.nbytes + on_level.nbytes + emissivity.nbytes
+    building = 2*n_members*n_max**2*matrix.itemsize
+    solving = 8*(matrix.size + 2*forcing.size) + 2*forcing.nbytes
+    held = inputs + sum(array.nbytes for array in transmission) + matrix.nbytes + max(building, solving, 12*forcing.nbytes)
+    bytes_per_member = held // max(n_members, 1)
+
+    t_atm[~in_column] = np.nan
+    heat_upward[~on_level] = np.nan
+    heat_dnward[~on_level] = np.nan
+    return AtmosEnsemble(t_surf.reshape(shape), t_atm.reshape(shape + (n_max,)),
+                         heat_upward.reshape(shape + (n_max+1,)), heat_dnward.reshape(shape + (n_max+1,)),
+                         1, residual.reshape(shape), converged.reshape(shape), bytes_per_member)
+
+# what atmos_sensitivity hands back: the equilibrium (as run_atmos_ensemble gives
+# it), and the derivatives of t_surf (shape + (3,)) and t_atm (shape + (n_layers, 3))
+# with respect to each of `parameters`, in K per unit of the parameter
+AtmosSensitivity = namedtuple('AtmosSensitivity', ['equilibrium', 'd_t_surf', 'd_t_atm', 'parameters'])
+
+def atmos_sensitivity(albedo=0.3, solar_constant = 1.36e3/4., emiss_atm = 0.2, n_layers = 10, tol=1e-6):
+    # how the equilibrium temperatures respond to albedo, solar_constant and emiss_atm,
+    # for a whole grid of columns at once (arguments as for run_atmos_ensemble). the
+    # balance is matrix @ sigma*T^4 = -forcing, so differentiating it gives
+    # matrix @ d(sigma*T^4) = -d(forcing) - d(matrix) @ sigma*T^4: one more solve with
+    # the same matrices, three right-hand sides, instead of six more model runs.
+    # d(matrix)/d(emiss_atm) is a central difference of the matrix alone.
+    equilibrium = run_atmos_ensemble(albedo, solar_constant, emiss_atm, n_layers, tol)
+    albedo, solar_constant, emiss_atm, n_layers = np.broadcast_arrays(albedo, solar_constant, emiss_atm, n_layers)
+    shape = albedo.shape
+    albedo, solar_constant, emiss_atm = [np.ravel(x).astype(float) for x in (albedo, solar_constant, emiss_atm)]
+    n_layers = np.ravel(n_layers).astype(int)
+    n_members = n_layers.size
+    n_max = n_layers.max(initial=0)
+    in_column = np.arange(n_max) < n_layers[:, np.newaxis]
+
+    t_all = np.concatenate([equilibrium.t_surf.reshape(n_members, 1), equilibrium.t_atm.reshape(n_members, n_max)], axis=1)
+    t_all = np.where(np.insert(in_column, 0, True, axis=1), t_all, 0.)
+    sigma_t4 = sb_const*t_all**4
+    emissivity, transmission, matrix = calc_padded_balance(emiss_atm, in_column)
+    step = 1e-6
+    d_matrix = (calc_padded_balance(emiss_atm + step, in_column)[2]
+                - calc_padded_balance(emiss_atm - step, in_column)[2])/(2*step)
+
+    rhs = np.zeros((n_members, n_max+1, 3))
+    rhs[:, 0, 0] = solar_constant # forcing = solar_constant*(1-albedo) at the surface
+    rhs[:, 0, 1] = albedo - 1.
+    rhs[:, :, 2] = -(d_matrix @ sigma_t4[..., np.newaxis])[..., 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        d_sigma_t4 = np.linalg.solve(matrix, rhs)
+        # T = (sigma*T^4/sigma)^(1/4), so dT = T/(4*sigma*T^4) * d(sigma*T^4)
+        d_t_all = d_sigma_t4 * (t_all/(4*sigma_t4))[..., np.newaxis]
+    d_t_all[:, 1:][~in_column] = np.nan
+    return AtmosSensitivity(equilibrium, d_t_all[:, 0].reshape(shape + (3,)),
+                            d_t_all[:, 1:].reshape(shape + (n_max, 3)), ('albedo', 'solar_constant', 'emiss_atm'))
+
+def run_atmos_model(albedo=0.3, solar_constant = 1.36e3/4., emiss_atm = 0.2, n_layers = 10, equilibrium=False, tol=None,
+                    workspace=None):
+    # equilibrium=True solves for the balanced column directly; otherwise step it
+    # forward in time (stopping early if tol is given), in workspace if one is given
+    if equilibrium:
+        return solve_atmos_model(albedo, solar_constant, emiss_atm, n_layers)
+    return integrate_atmos_model(albedo, solar_constant, emiss_atm, n_layers, tol=tol, workspace=workspace)
+
+# The widget's sliders only ever land on these values (albedo, solar constant and
+# greenhouse in percent), so every column it can show can be solved ahead of time
+# and kept on disk as one table indexed by slider position.
+table_albedo = np.arange(0, 100, 10)
+table_solar = np.arange(80, 210, 10)
+table_emiss = np.arange(10, 110, 10)
+table_layers = np.arange(0, 26)
+table_format = 1 # bump this when the physics changes in a way the constants don't show
+
+def atmos_table_version():
+    # a short hash of everything the table depends on; a table built with different
+    # constants or a different grid has a different name and is never picked up
+    key = repr((table_format, sb_const, sp_heat_capacity_water, density_water, sp_heat_capacity_air, gravity,
+                table_albedo.tolist(), table_solar.tolist(), table_emiss.tolist(), table_layers.tolist()))
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+def atmos_table_filename(directory='.'):
+    return os.path.join(directory, 'atmos_table_{}.npy'.format(atmos_table_version()))
+
+def atmos_table_dtype():
+    n_max = table_layers.max()
+    return np.dtype([('t_surf', float), ('t_atm', float, (n_max,)), ('heat_upward', float, (n_max+1,)),
+                     ('heat_dnward', float, (n_max+1,)), ('residual', float), ('converged', bool)])
+
+def solve_atmos_table_slice(albedo_pct):
+    # every column in the table with one albedo; what each worker does
+    solar_pct, emiss_pct, n_layers = np.meshgrid(table_solar, table_emiss, table_layers, indexing='ij')
+    with warnings.catch_warnings():
+        # the converged flag goes into the table instead
+        warnings.simplefilter('ignore')
+        result = run_atmos_ensemble(albedo_pct/100., 1.36e3/4.*solar_pct/100., emiss_pct/100., n_layers)
+    rows = np.zeros(n_layers.shape, dtype=atmos_table_dtype())
+    for name in rows.dtype.names:
+        rows[name] = getattr(result, name)
+    return rows
+
+def build_atmos_table(directory='.', max_workers=None):
+    # solve the whole slider grid, one albedo per task across a process pool, and
+    # save it where load_atmos_table will look for it. returns the file name.
+    filename = atmos_table_filename(directory)
+    partial = filename + '.partial'
+    shape = (len(table_albedo), len(table_solar), len(table_emiss), len(table_layers))
+    table = np.lib.format.open_memmap(partial, mode='w+', dtype=atmos_table_dtype(), shape=shape)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for ii, rows in enumerate(pool.map(solve_atmos_table_slice, table_albedo)):
+            table[ii] = rows
+    table.flush()
+    del table
+    os.replace(partial, filename)
+    return filename
+
+def load_atmos_table(directory='.'):
+    # the table for the current constants, memory-mapped, or None if it hasn't been built
+    filename = atmos_table_filename(directory)
+    if not os.path.exists(filename):
+        return None
+    return np.load(filename, mmap_mode='r')
+
+def lookup_atmos_table(table, albedo_pct, solar_pct, emiss_pct, n_layers):
+    # the stored column for one set of slider positions, as an AtmosResult like
+    # solve_atmos_model gives; None if there's no table or the values are off the grid
+    if table is None:
+        return None
+    index = []
+    for value, axis in zip((albedo_pct, solar_pct, emiss_pct, n_layers),
+                           (table_albedo, table_solar, table_emiss, table_layers)):
+        ii = int(round((value - axis[0])/(axis[1] - axis[0])))
+        if not (0 <= ii < len(axis) and axis[ii] == value):
+            return None
+        index.append(ii)
+    row = table[tuple(index)]
+    return AtmosResult(float(row['t_surf']), np.array(row['t_atm'][:n_layers]),
+                       np.array(row['heat_upward'][:n_layers+1]), np.array(row['heat_dnward'][:n_layers+1]),
+                       1, float(row['residual']), bool(row['converged']))
+
+if __name__ == '__main__':
+    # python atmos_core.py builds the widget's table in the current directory
+    print(build_atmos_table())
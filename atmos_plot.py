@@ -0,0 +1,132 @@
+# The atmosphere model's plot: the layered column with its heat arrows.
+import numpy as np
+from matplotlib import pyplot as plt
+from plot_tools import Blitter
+import profiling
+
+def column_levels(n_layers):
+    # where the surface, each layer and space sit on the plot's pressure axis
+    if n_layers >= 1:
+        levdiff = 1000./n_layers
+        plevels = np.insert(np.array([1010, 0, -200]), 1, 1000.-levdiff*np.arange(n_layers))
+    else:
+        levdiff = 100
+        plevels = np.array([1010, 0, -200])
+    return levdiff, plevels
+
+def arrow_style(width, head_scale):
+    return dict(width=width, head_width=width*head_scale)
+
+class AtmosRenderer:
+    # draws the axes, ticks and labels once and keeps one of every other artist the
+    # column can need, for up to max_layers layers. an update recolors the mesh, moves
+    # the temperature line, resizes the arrows and rewrites the labels; arrows for
+    # layers the column doesn't have are hidden, not removed, so an update costs the
+    # same however many layers there are.
+    def __init__(self, ax, max_layers=25, mesh_rows=1315):
+        self.ax = ax
+        # a fine fixed grid of rows that every column's layers are painted onto
+        self.row_edges = np.linspace(1015, -300, mesh_rows+1)
+        self.row_centers = (self.row_edges[:-1] + self.row_edges[1:])/2.
+        self.mesh = ax.pcolormesh([200, 1000], self.row_edges, np.zeros((mesh_rows, 1)), cmap='bone')
+        self.line, = ax.plot([], [], color='deepskyblue')
+
+        self.surface_up = ax.arrow(850, 1010, 0, -50, width=1, fc='red', ec='red')
+        self.layer_arrows = []
+        self.add_layers(max_layers)
+        self.sun_down = ax.arrow(600, 0, 0, 950, width=1, fc='yellow', ec='gold')
+        self.sun_up = ax.arrow(700, 1000, 0, -1000, width=1, fc='yellow', ec='gold')
+
+        self.surface_label = ax.text(0, 1000, '', color='deepskyblue')
+        self.solar_label = ax.text(600, -180, '', color='yellow', ha='center', va='top', bbox=dict(facecolor='black', alpha=0.5))
+        self.reflected_label = ax.text(700, -120, '', color='yellow', ha='center', va='top', bbox=dict(facecolor='black', alpha=0.5))
+        self.outgoing_label = ax.text(850, -120, '', color='red', ha='center', va='top', bbox=dict(facecolor='black', alpha=0.5))
+        ax.set_xticks([200, 300, 400, 500, 600, 700, 850, 950], labels=['200', '300', '400', '500', 'solar\ndown', 'solar\nup', 'thermal\nup', 'thermal\ndown'])
+        ax.set_yticks([1000, 0], labels=('surface', 'space'))
+        # these and the spines sit on top of the mesh, so they're redrawn with it
+        self.divider = ax.axvline(500, color='black', linewidth=0.75)
+        self.line_label = ax.text(350, 0, 'temperature', color='deepskyblue', ha='center')
+        ax.set_title('Multi-layer greenhouse atmosphere model')
+        ax.set_ylim(1010, -200)
+        ax.set_xlim(200, 1000)
+        self.blitter = Blitter(ax.figure.canvas, self.dynamic_artists())
+
+    def add_layers(self, max_layers):
+        # one pair of arrows (down, up) between each two layers, made in the same order
+        # the old plot drew them in so they overlap the same way
+        for ii in range(len(self.layer_arrows), max(max_layers-1, 0)):
+            self.layer_arrows.append((self.ax.arrow(950, 0, 0, 1, width=1, fc='red', ec='red', visible=False),
+                                      self.ax.arrow(850, 0, 0, -1, width=1, fc='red', ec='red', visible=False)))
+
+    def dynamic_artists(self):
+        return ([self.mesh, self.line, self.surface_up] + [arrow for pair in self.layer_arrows for arrow in pair]
+                + [self.sun_down, self.sun_up, self.surface_label, self.solar_label, self.reflected_label, self.outgoing_label,
+                   self.divider, self.line_label] + list(self.ax.spines.values()))
+
+    def update(self, result, albedo=0.3, solar_constant = 1.36e3/4.):
+        t_surf, t_atm, heat_upward, heat_dnward = result[:4]
+        n_layers = len(t_atm)
+        if n_layers > len(self.layer_arrows) + 1:
+            self.add_layers(n_layers)
+            self.blitter.artists = self.dynamic_artists()
+            self.blitter.forget()
+
+        #heat from the sun
+        sun_reflected = solar_constant*albedo
+        heat_from_the_sun = solar_constant - sun_reflected
+        levdiff, plevels = column_levels(n_layers)
+
+        with profiling.span('plot.pcolormesh'):
+            if n_layers >= 1:
+                t_all = np.insert(np.array([t_surf, t_atm[-1], t_atm[-1]]), 1, t_atm)
+                # each row takes the temperature of the level it's closest to, as
+                # pcolormesh would draw one cell per level
+                boundaries = (plevels[:-1] + plevels[1:])/2.
+                self.mesh.set_array(t_all[np.searchsorted(-boundaries, -self.row_centers)])
+                self.mesh.set_cmap('bone')
+                self.mesh.set_clim(t_all.min(), t_all.max())
+                self.line.set_data(t_all[:-2], plevels[:-2])
+                self.line.set_visible(True)
+            else:
+                self.mesh.set_array(np.zeros(len(self.row_centers)))
+                self.mesh.set_cmap('viridis')
+                self.mesh.set_clim(0., 0.)
+                self.line.set_visible(False)
+
+        with profiling.span('plot.arrows'):
+            max_heat = np.max(np.array([np.max(heat_upward), heat_from_the_sun, sun_reflected]))
+            max_w = 40
+            up_w = max_w * heat_upward / max_heat
+            dn_w = max_w * heat_dnward / max_heat
+            sun_dn_w =  max_w * solar_constant / max_heat
+            sun_up_w = max_w * sun_reflected / max_heat
+
+            self.surface_up.set_data(dy=-levdiff*.5, **arrow_style(up_w[0], 2.))
+            for ii, (down, up) in enumerate(self.layer_arrows, start=2):
+                in_column = ii <= n_layers
+                down.set_visible(in_column)
+                up.set_visible(in_column)
+                if in_column:
+                    down.set_data(y=plevels[ii], dy=levdiff*.5, **arrow_style(dn_w[ii], 2.))
+                    up.set_data(y=plevels[ii], dy=-levdiff*.5, **arrow_style(up_w[ii], 2.))
+            self.sun_down.set_data(**arrow_style(sun_dn_w, 4.))
+            self.sun_up.set_data(**arrow_style(sun_up_w, 4.))
+
+        with profiling.span('plot.text'):
+            self.surface_label.set_position((t_surf, 1000))
+            self.surface_label.set_text('{:.0f} K'.format(t_surf))
+            self.solar_label.set_text('{:.0f}'.format(solar_constant) + r' Wm$^{-2}$')
+            self.reflected_label.set_text('{:.0f}'.format(sun_reflected) + r' Wm$^{-2}$')
+            self.outgoing_label.set_text('{:.0f}'.format(heat_upward[-1]) + r' Wm$^{-2}$')
+        self.blitter.redraw()
+
+def plot_atmos_model(ax, result, albedo=0.3, solar_constant = 1.36e3/4.):
+    # one-off plot of a run; the widget keeps an AtmosRenderer around instead
+    renderer = AtmosRenderer(ax, max_layers=len(result[1]))
+    renderer.update(result, albedo, solar_constant)
+    return renderer
+
+def atmos_figure():
+    # the widget's figure
+    fig, ax = plt.subplots()
+    return fig, AtmosRenderer(ax)
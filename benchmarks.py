@@ -0,0 +1,159 @@
+# Timings for the model kernels and the widgets, to catch things getting slower.
+#
+#     python benchmarks.py run baseline.json [--quick] [--only atmos]
+#     python benchmarks.py compare baseline.json new.json [--threshold 1.25]
+#
+# "run" times everything and saves {benchmark name: seconds} (plus where it ran) as
+# JSON; "compare" lines two of those files up and exits with status 1 if anything
+# got slower than threshold times its baseline. --quick skips the biggest sizes.
+# run it from this directory, on an otherwise idle machine; timings from different
+# machines aren't comparable.
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+import numpy as np
+
+atmos_layers = [0, 1, 2, 5, 10, 25, 50, 100]
+carbon_iterations = [100, 1000, 10000, 100000, 1000000]
+planet_rows = 1000000
+
+def best_time(function, min_total=0.2, max_repeats=5):
+    # the fastest of a few calls (fewer if each call is slow)
+    times = []
+    while len(times) < max_repeats and sum(times) < min_total:
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def bench_atmos(quick=False):
+    from atmos_core import run_atmos_model
+    results = {}
+    for n_layers in atmos_layers:
+        if quick and n_layers > 25:
+            continue
+        results['atmos.integrate.n_layers={}'.format(n_layers)] = best_time(lambda: run_atmos_model(n_layers=n_layers))
+        results['atmos.solve.n_layers={}'.format(n_layers)] = best_time(lambda: run_atmos_model(n_layers=n_layers, equilibrium=True))
+    return results
+
+def bench_carbon(quick=False):
+    # the default switches, then each one flipped on its own
+    from carbon_core import run_model, switch_defaults
+    modes = {'default': {}}
+    modes.update({'{}={}'.format(name, not value): {name: not value} for name, value in switch_defaults.items()})
+    results = {}
+    for mode, switches in modes.items():
+        for n_iterations in carbon_iterations:
+            if quick and n_iterations > 10000:
+                continue
+            results['carbon.{}.n_iterations={}'.format(mode, n_iterations)] = best_time(
+                lambda: run_model(n_iterations=n_iterations, **switches))
+    return results
+
+def bench_planet(quick=False):
+    # seconds per million planets
+    from planet_core import calc_temp_from_sun, evaluate_catalog, earth_dist
+    rng = np.random.default_rng(0)
+    distance = rng.uniform(0.1, 50., planet_rows)
+    catalog = dict(distance=distance, T_star=rng.uniform(3000., 9000., planet_rows),
+                   r_star=rng.uniform(0.2, 3., planet_rows), albedo=rng.uniform(0., 0.7, planet_rows),
+                   t_obs=rng.uniform(30., 2000., planet_rows))
+    return {'planet.calc_temp_from_sun.rows=1e6': best_time(lambda: calc_temp_from_sun(earth_dist*distance)),
+            'planet.evaluate_catalog.rows=1e6': best_time(lambda: evaluate_catalog(catalog))}
+
+def widget_namespace(filename):
+    # what a notebook gets from exec(open(filename).read()), on the Agg backend
+    import matplotlib
+    matplotlib.use('Agg')
+    namespace = {}
+    exec(open(filename).read(), namespace)
+    return namespace
+
+def bench_widgets(quick=False):
+    # one update as the user sees it: callback plus a full draw of the figure.
+    # outside a notebook there's no event loop, so BackgroundUpdater runs inline.
+    from matplotlib import pyplot as plt
+    with redirect_stdout(io.StringIO()): # the widgets print as they update
+        results = time_widgets()
+    plt.close('all')
+    return results
+
+def time_widgets():
+    results = {}
+
+    planet = widget_namespace('planet_model.py')
+    distances = iter(np.tile(np.linspace(0.5, 40., 50), 100))
+    def planet_update():
+        planet['update'](next(distances))
+        planet['fig'].canvas.draw()
+    results['widget.planet.update'] = best_time(planet_update)
+
+    atmos = widget_namespace('atmos_model.py')
+    def atmos_update():
+        atmos['sl_layers'].value = 25 if atmos['sl_layers'].value != 25 else 10
+        atmos['fig'].canvas.draw()
+    results['widget.atmos.update_plot'] = best_time(atmos_update)
+
+    carbon = widget_namespace('carbon_model.py')
+    def carbon_update():
+        carbon['ocean_up_checkbox'].value = not carbon['ocean_up_checkbox'].value
+        carbon['fig'].canvas.draw()
+    results['widget.carbon.update_plot'] = best_time(carbon_update)
+    return results
+
+benchmarks = {'atmos': bench_atmos, 'carbon': bench_carbon, 'planet': bench_planet, 'widgets': bench_widgets}
+
+def run_benchmarks(only=None, quick=False, progress=print):
+    results = {}
+    for name, bench in benchmarks.items():
+        if only and name not in only:
+            continue
+        for key, seconds in bench(quick).items():
+            progress('{:50s} {:10.6f} s'.format(key, seconds))
+            results[key] = seconds
+    import kernels
+    return dict(machine=dict(python=platform.python_version(), numpy=np.__version__, platform=platform.platform(),
+                             processor=platform.processor(), backend=kernels.backend,
+                             date=datetime.now(timezone.utc).isoformat()),
+                results=results)
+
+def compare_benchmarks(baseline, new, threshold=1.25):
+    # [(name, baseline seconds, new seconds, ratio)] for the benchmarks in both, and the
+    # ones that are more than threshold times slower
+    rows = [(name, baseline['results'][name], seconds, seconds/baseline['results'][name])
+            for name, seconds in new['results'].items() if name in baseline['results']]
+    return rows, [row for row in rows if row[3] > threshold]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the models and widgets, or compare two sets of timings.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='time everything and save the results as JSON')
+    run.add_argument('output')
+    run.add_argument('--quick', action='store_true', help='skip the biggest sizes')
+    run.add_argument('--only', nargs='+', choices=list(benchmarks), help='just these groups')
+    compare = commands.add_parser('compare', help='flag benchmarks that got slower than a baseline')
+    compare.add_argument('baseline')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio to flag (default 1.25)')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        with open(args.output, 'w') as file:
+            json.dump(run_benchmarks(args.only, args.quick), file, indent=1)
+    else:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.new) as file:
+            new = json.load(file)
+        rows, slower = compare_benchmarks(baseline, new, args.threshold)
+        for name, old_seconds, new_seconds, ratio in rows:
+            flag = '  SLOWER' if ratio > args.threshold else ''
+            print('{:50s} {:10.6f} {:10.6f} {:6.2f}x{}'.format(name, old_seconds, new_seconds, ratio, flag))
+        if slower:
+            print('{} of {} benchmarks are more than {}x slower than the baseline'.format(len(slower), len(rows), args.threshold))
+            sys.exit(1)
@@ -0,0 +1,882 @@
+# The carbon-cycle reservoir model: the flux table, the yearly step, and faster ways to run it.
+import numpy as np
+import threading
+import profiling
+import kernels
+from collections import namedtuple
+from functools import lru_cache
+from itertools import product
+from types import MappingProxyType
+
+# reservoirs (PgC), pre-industrial (_n) and modern (_a)
+atmosphere_n_0 = 589
+atmosphere_a_0 = 589 + 240
+fuel_reserves_n_0 = 1500
+fuel_reserves_a_0 = 1500 + 375
+vegetation_n_0 = 455
+vegetation_a_0 = 455 + 20
+soil_0 = 1900
+permafrost_0 = 1700
+surface_ocean_n_0 = 900
+deep_ocean_0 = 37100
+extra_in_ocean = 155
+surface_ocean_a_0 = 900 + 155
+marine_biota_0 = 3
+dissolved_organic_0 = 700
+rvr2sea_n = 0.9
+
+# natural fluxes (PgC/yr)
+rock2rivr_n = 0.1    # from rock
+burial_n = 0.2    # burial from rivers
+atm2rivr_n = 0.3        # rock weathering by rivers
+soil2rivr_n = 1.7        # exports from soil to rivers
+veg2soil_n = 1.7        # a missing number from the figure
+sfc2bio_n = 50        # surface-biota exchange
+bio2sfc_n = 37        # surface-biota exchange
+bio2doc_n = 2        # biota-DOC exchanges
+doc2deep_n = 2        # DOC-deep ocean exchange
+bio2deep_n = 11        # biota-deep exchange
+rivr2atm_n = 1.        # freshwater outgassing
+# surface ocean & deep ocean exchanges
+# the balance from the book has a bit extra going to the deep sea
+sfc2deep_n = 88.2 # 90 is what's in the figure; I tweaked it for balance
+deep2sfc_n = 101
+sfc2atm_n = 60.7
+atm2sfc_n = 60
+sfc2atm_a = 60.7 + 17.7
+atm2sfc_a = 60 + 20
+veg2atm_n = 107.2
+atm2veg_n = 108.9
+veg2atm_a = 107.2 + 11.6
+atm2veg_a = 108.9 + 14.1
+deep2rock_n = 0.2
+rivers_n = rock2rivr_n+atm2rivr_n+soil2rivr_n
+
+# volcanism
+# walters et al. has 0.1 but I'm using 0.3 to balance the natural model
+# walters et al. also has a nearly 2.0 imbalance between the surface and deep oceans
+# so another logical way to balance this would be to increase the net flux
+# to the ocean, but I didn't want to mess with that part of the carbon flux
+volc_n = 0.3
+
+# the constants above that a run can override (see model_constants)
+constant_names = ['atmosphere_n_0', 'atmosphere_a_0', 'fuel_reserves_n_0', 'fuel_reserves_a_0',
+                  'vegetation_n_0', 'vegetation_a_0', 'soil_0', 'permafrost_0',
+                  'surface_ocean_n_0', 'deep_ocean_0', 'surface_ocean_a_0', 'marine_biota_0',
+                  'dissolved_organic_0', 'rvr2sea_n', 'rock2rivr_n', 'burial_n',
+                  'atm2rivr_n', 'soil2rivr_n', 'veg2soil_n', 'sfc2bio_n',
+                  'bio2sfc_n', 'bio2doc_n', 'doc2deep_n', 'bio2deep_n',
+                  'rivr2atm_n', 'sfc2deep_n', 'deep2sfc_n', 'sfc2atm_n',
+                  'atm2sfc_n', 'sfc2atm_a', 'atm2sfc_a', 'veg2atm_n',
+                  'atm2veg_n', 'veg2atm_a', 'atm2veg_a', 'deep2rock_n',
+                  'rivers_n', 'volc_n']
+
+# the reservoirs, in the order they're stored in the model's state array
+reservoirs = ['atmosphere', 'fuel_reserves', 'vegetation', 'deep_ocean', 'soil',
+              'permafrost', 'surface_ocean', 'marine_biota', 'dissolved_organic']
+
+# what run_model hands back: each reservoir's trajectory, plus the fluxes
+# (keyed by name, e.g. 'atm2sfc') from the last simulated year
+CarbonResult = namedtuple('CarbonResult', reservoirs + ['fluxes'])
+
+# one row of the flux table: carbon moves from source to sink at a rate given by
+# rule, a (constant, {reservoir: rate per PgC}) pair, so
+#     flux = constant + sum(rate * amount in reservoir)
+# optionally clipped to limits=(lowest, highest). 'rivers' only passes carbon
+# through, and None means outside the model (rocks, sediments, volcanoes, cement).
+Flux = namedtuple('Flux', ['name', 'source', 'sink', 'rule', 'limits'], defaults=[None])
+
+# the flux table turned into arrays so a whole year can be done at once
+FluxNetwork = namedtuple('FluxNetwork', ['names', 'offset', 'slope', 'lower', 'upper',
+                                         'incidence', 'river_incidence', 'outside_incidence'])
+
+def proport(pi_amount, pi_flux, current_amount, verbose=False):
+    k_constant = pi_flux/pi_amount
+    current_flux = k_constant * current_amount
+    if verbose:
+        print(pi_amount, pi_flux, current_amount, current_flux)
+    return current_flux
+
+def linear_extrap(pi_amount, y2k_amount, current_amount, pi_flux, y2k_flux, verbose=False):
+    rise_over_run = (y2k_flux - pi_flux) / (y2k_amount - pi_amount)
+    dx = current_amount - pi_amount
+    current_flux = pi_flux + dx*rise_over_run
+    if verbose:
+        print(pi_amount, y2k_amount, current_amount, pi_flux, y2k_flux, current_flux)
+    return current_flux
+
+def const_rule(flux):
+    return (flux, {})
+
+def proport_rule(reservoir, pi_amount, pi_flux):
+    # the rule version of proport()
+    return (0., {reservoir: pi_flux/pi_amount})
+
+def linear_extrap_rule(reservoir, pi_amount, y2k_amount, pi_flux, y2k_flux):
+    # the rule version of linear_extrap()
+    rise_over_run = (y2k_flux - pi_flux) / (y2k_amount - pi_amount)
+    return (pi_flux - pi_amount*rise_over_run, {reservoir: rise_over_run})
+
+def combine_rules(*terms):
+    # weighted sum of rules, given as (weight, rule) pairs
+    constant = 0.
+    rates = {}
+    for weight, (term_constant, term_rates) in terms:
+        constant += weight*term_constant
+        for reservoir, rate in term_rates.items():
+            rates[reservoir] = rates.get(reservoir, 0.) + weight*rate
+    return (constant, rates)
+
+def model_constants(**overrides):
+    # the reservoir and flux constants, with some of them replaced. values can be
+    # arrays with one entry per ensemble member. rivers_n follows its three parts
+    # unless it is given too.
+    unknown = set(overrides) - set(constant_names)
+    if unknown:
+        raise TypeError('unknown model constant(s): ' + ', '.join(sorted(unknown)))
+    constants = {name: globals()[name] for name in constant_names}
+    constants.update(overrides)
+    if 'rivers_n' not in overrides:
+        constants['rivers_n'] = constants['rock2rivr_n'] + constants['atm2rivr_n'] + constants['soil2rivr_n']
+    return constants
+
+def initial_state(humans=True, constants=None):
+    c = model_constants() if constants is None else constants
+    # starting amount in each reservoir, in the order of `reservoirs`
+    state = dict(atmosphere=c['atmosphere_n_0'], fuel_reserves=c['fuel_reserves_n_0'], vegetation=c['vegetation_n_0'],
+                 deep_ocean=c['deep_ocean_0'], soil=c['soil_0'], permafrost=c['permafrost_0'],
+                 surface_ocean=c['surface_ocean_n_0'], marine_biota=c['marine_biota_0'],
+                 dissolved_organic=c['dissolved_organic_0'])
+    if humans:
+        state.update(atmosphere=c['atmosphere_a_0'], fuel_reserves=c['fuel_reserves_a_0'],
+                     vegetation=c['vegetation_a_0'], surface_ocean=c['surface_ocean_a_0'])
+    return np.stack(np.broadcast_arrays(*[state[name] for name in reservoirs]), axis=-1).astype(float)
+
+def make_flux_table(humans=True, buffered_up_ocn=False, buffered_down_ocn=False, buffered_up_veg=False, buffered_down_veg=False, proportionate=False, constants=None):
+    # every flux in the model. adding a reservoir or a flux is a matter of adding
+    # rows here; the same fluxes are present for every setting, only the rules change.
+    # constants comes from model_constants() and defaults to the values above.
+    c = model_constants() if constants is None else constants
+    start = dict(zip(reservoirs, np.moveaxis(initial_state(humans, c), -1, 0)))
+    surface_ocean_start = start['surface_ocean']
+
+    # we're going to keep a constant weathering rate here to get the rivers started
+    rock2rivr = const_rule(c['rock2rivr_n'])
+    # how much the rivers get in them from the atmosphere and soil may depend on
+    # how much carbon is in them
+    if proportionate:
+        atm2rivr = proport_rule('atmosphere', c['atmosphere_n_0'], c['atm2rivr_n'])
+        soil2rivr = proport_rule('soil', c['soil_0'], c['soil2rivr_n'])
+    else:
+        atm2rivr = const_rule(c['atm2rivr_n'])
+        soil2rivr = const_rule(c['soil2rivr_n'])
+    rivers = combine_rules((1., rock2rivr), (1., atm2rivr), (1., soil2rivr))
+
+    if proportionate:
+        sfc2bio = proport_rule('surface_ocean', surface_ocean_start, c['sfc2bio_n'])
+        bio2sfc = proport_rule('surface_ocean', surface_ocean_start, c['bio2sfc_n'])
+        bio2doc = proport_rule('surface_ocean', surface_ocean_start, c['bio2doc_n'])
+        bio2deep = proport_rule('surface_ocean', surface_ocean_start, c['bio2deep_n'])
+        doc2deep = proport_rule('dissolved_organic', c['dissolved_organic_0'], c['doc2deep_n'])
+        sfc2deep = proport_rule('surface_ocean', surface_ocean_start, c['sfc2deep_n'])
+        deep2sfc = proport_rule('deep_ocean', c['deep_ocean_0'], c['deep2sfc_n'])
+        burial = combine_rules((c['burial_n']/c['rivers_n'], rivers))
+        rivr2atm = combine_rules((c['rivr2atm_n']/c['rivers_n'], rivers))
+        deep2rock = proport_rule('deep_ocean', c['deep_ocean_0'], c['deep2rock_n'])
+    else:
+        sfc2bio = const_rule(c['sfc2bio_n'])
+        bio2sfc = const_rule(c['bio2sfc_n'])
+        bio2doc = const_rule(c['bio2doc_n'])
+        bio2deep = const_rule(c['bio2deep_n'])
+        doc2deep = const_rule(c['doc2deep_n'])
+        sfc2deep = const_rule(c['sfc2deep_n'])
+        deep2sfc = const_rule(c['deep2sfc_n'])
+        burial = const_rule(c['burial_n'])
+        rivr2atm = const_rule(c['rivr2atm_n'])
+        deep2rock = const_rule(c['deep2rock_n'])
+    # rivers empty into ocean
+    rvr2sea = combine_rules((1., rivers), (-1., rivr2atm), (-1., burial))
+
+    # let's just assume we're done ruining all the plants
+    veg2soil = (-start['vegetation'], {'vegetation': 1.})
+
+    if humans:
+        land_use = const_rule(1.1)
+        fossil_fuel = (0., {'fuel_reserves': 1.}) # burn what's left, up to 4.8 (7.8 for fossil fuels + cement)
+        cement = const_rule(3) # super rough guess at cement
+
+        # human-influenced ocean-to-atmosphere and atmosphere to ocean
+        if buffered_up_ocn:
+            sfc2atm = linear_extrap_rule('surface_ocean', c['surface_ocean_n_0'], c['surface_ocean_a_0'], c['sfc2atm_n'], c['sfc2atm_a'])
+        else:
+            sfc2atm = const_rule(c['sfc2atm_a'])
+        if buffered_down_ocn:
+            atm2sfc = linear_extrap_rule('atmosphere', c['atmosphere_n_0'], c['atmosphere_a_0'], c['atm2sfc_n'], c['atm2sfc_a'])
+        else:
+            atm2sfc = const_rule(c['atm2sfc_a'])
+
+        # human-influenced respiration and photosynthesis
+        if buffered_up_veg:
+            veg2atm = linear_extrap_rule('vegetation', c['vegetation_n_0'], c['vegetation_a_0'], c['veg2atm_n'], c['veg2atm_a'])
+        else:
+            veg2atm = const_rule(c['veg2atm_a'])
+        if buffered_down_veg:
+            atm2veg = linear_extrap_rule('atmosphere', c['atmosphere_n_0'], c['atmosphere_a_0'], c['atm2veg_n'], c['atm2veg_a'])
+        else:
+            atm2veg = const_rule(c['atm2veg_a'])
+    else:
+        land_use = const_rule(0.)
+        fossil_fuel = const_rule(0.)
+        cement = const_rule(0.)
+        # natural ocean-to-atmosphere and atmosphere to ocean
+        sfc2atm = const_rule(c['sfc2atm_n'])
+        atm2sfc = const_rule(c['atm2sfc_n'])
+        veg2atm = const_rule(c['veg2atm_n'])
+        atm2veg = const_rule(c['atm2veg_n'])
+
+    return [
+        Flux('rock2rivr', None, 'rivers', rock2rivr),
+        Flux('atm2rivr', 'atmosphere', 'rivers', atm2rivr),
+        Flux('soil2rivr', 'soil', 'rivers', soil2rivr),
+        Flux('rivr2atm', 'rivers', 'atmosphere', rivr2atm),
+        Flux('burial', 'rivers', None, burial),
+        Flux('rvr2sea', 'rivers', 'surface_ocean', rvr2sea),
+        Flux('veg2soil', 'vegetation', 'soil', veg2soil),
+        Flux('sfc2bio', 'surface_ocean', 'marine_biota', sfc2bio),
+        Flux('bio2sfc', 'marine_biota', 'surface_ocean', bio2sfc),
+        Flux('bio2doc', 'marine_biota', 'dissolved_organic', bio2doc),
+        Flux('doc2deep', 'dissolved_organic', 'deep_ocean', doc2deep),
+        Flux('bio2deep', 'marine_biota', 'deep_ocean', bio2deep),
+        Flux('sfc2deep', 'surface_ocean', 'deep_ocean', sfc2deep),
+        Flux('deep2sfc', 'deep_ocean', 'surface_ocean', deep2sfc),
+        Flux('deep2rock', 'deep_ocean', None, deep2rock), # deep ocean to ocean floor
+        Flux('volc', None, 'atmosphere', const_rule(c['volc_n'])),
+        Flux('land_use', 'vegetation', 'atmosphere', land_use),
+        Flux('fossil_fuel', 'fuel_reserves', 'atmosphere', fossil_fuel, (0., 4.8)),
+        Flux('cement', None, 'atmosphere', cement),
+        Flux('sfc2atm', 'surface_ocean', 'atmosphere', sfc2atm),
+        Flux('atm2sfc', 'atmosphere', 'surface_ocean', atm2sfc),
+        Flux('veg2atm', 'vegetation', 'atmosphere', veg2atm),
+        Flux('atm2veg', 'atmosphere', 'vegetation', atm2veg),
+    ]
+
+def compile_flux_table(table):
+    # turn the flux table into arrays: fluxes = clip(offset + slope @ state, lower, upper),
+    # and each reservoir changes by incidence @ fluxes. if the rules hold arrays (one
+    # value per ensemble member), offset and slope get a leading member axis.
+    n_fluxes = len(table)
+    values = [flux.rule[0] for flux in table] + [rate for flux in table for rate in flux.rule[1].values()]
+    shape = np.broadcast_shapes(*[np.shape(value) for value in values])
+    offset = np.zeros(shape + (n_fluxes,))
+    slope = np.zeros(shape + (n_fluxes, len(reservoirs)))
+    lower = np.full(n_fluxes, -np.inf)
+    upper = np.full(n_fluxes, np.inf)
+    incidence = np.zeros((len(reservoirs), n_fluxes))
+    river_incidence = np.zeros(n_fluxes)
+    outside_incidence = np.zeros(n_fluxes)
+    for ff, flux in enumerate(table):
+        offset[..., ff], rates = flux.rule
+        for reservoir, rate in rates.items():
+            slope[..., ff, reservoirs.index(reservoir)] = rate
+        if flux.limits is not None:
+            lower[ff], upper[ff] = flux.limits
+        for node, sign in ((flux.source, -1.), (flux.sink, 1.)):
+            if node is None:
+                outside_incidence[ff] += sign
+            elif node == 'rivers':
+                river_incidence[ff] += sign
+            else:
+                incidence[reservoirs.index(node), ff] += sign
+    return FluxNetwork([flux.name for flux in table], offset, slope, lower, upper,
+                       incidence, river_incidence, outside_incidence)
+
+def make_step(network):
+    # one model year as a function: step(state, out) writes next year's state into
+    # out and returns that year's fluxes (in a buffer reused every year).
+    # step.imbalance keeps the worst carbon conservation error seen so far.
+
+    # only a few fluxes have limits, so only clip those
+    limited = np.flatnonzero(np.isfinite(network.lower) | np.isfinite(network.upper))
+    lower, upper = network.lower[limited], network.upper[limited]
+    # rows for each reservoir's change, then two checks that should be zero every
+    # year: what the rivers keep, and the total carbon created or destroyed
+    # (counting what goes to or comes from outside)
+    conservation = np.vstack([network.river_incidence,
+                              network.incidence.sum(axis=0) + network.river_incidence + network.outside_incidence])
+    to_nodes = np.vstack([network.incidence, conservation])
+    n_reservoirs = len(network.incidence)
+    fluxes = np.zeros(len(network.names))
+    clipped = np.zeros(len(limited))
+    change = np.zeros(len(to_nodes))
+    imbalance = np.zeros(len(conservation))
+    error = np.zeros(len(conservation))
+
+    def step(state, out):
+        # everything goes into the buffers above, so a year allocates nothing
+        np.dot(network.slope, state, out=fluxes)
+        np.add(fluxes, network.offset, out=fluxes)
+        np.take(fluxes, limited, out=clipped)
+        np.maximum(clipped, lower, out=clipped)
+        np.minimum(clipped, upper, out=clipped)
+        np.put(fluxes, limited, clipped)
+        np.dot(to_nodes, fluxes, out=change)
+        np.add(state, change[:n_reservoirs], out=out)
+        np.abs(change[n_reservoirs:], out=error)
+        np.maximum(imbalance, error, out=imbalance)
+        return fluxes
+
+    step.imbalance = imbalance
+    # what kernels.carbon_steps needs to run the same years in one call
+    step.arrays = (network.slope, network.offset, limited, lower, upper, to_nodes, n_reservoirs)
+    return step
+
+def flux_history(network, state):
+    # every year's fluxes at once, from a run's states (one row per year): row ii is
+    # what took state[ii] to state[ii+1], the same as step() gave that year (to rounding)
+    fluxes = state[:-1] @ np.swapaxes(network.slope, -1, -2) + network.offset
+    return np.minimum(np.maximum(fluxes, network.lower), network.upper)
+
+def check_conservation(step):
+    if np.any(step.imbalance > 1e-9):
+        raise RuntimeError('carbon is not conserved (off by up to {:.3g} PgC/yr)'.format(step.imbalance.max()))
+
+class CarbonWorkspace:
+    # Everything run_model needs, made once and reused by every run given it: the
+    # state array for up to n_iterations years, and each scenario's flux network and
+    # step function. A run in a workspace allocates nothing per year, and its result's
+    # reservoirs are views into the workspace, so they're overwritten by the next run.
+    def __init__(self, n_iterations=1000):
+        self.state = np.zeros((n_iterations, len(reservoirs)))
+        self.steps = {}
+
+    def network_and_step(self, switches):
+        switches = tuple(bool(switch) for switch in switches)
+        if switches not in self.steps:
+            network = compile_flux_table(make_flux_table(*switches))
+            self.steps[switches] = (network, make_step(network))
+        network, step = self.steps[switches]
+        step.imbalance[:] = 0.
+        return network, step
+
+def run_model(humans=True, n_iterations = 1000, buffered_up_ocn=False, buffered_down_ocn=False, buffered_up_veg=False, buffered_down_veg=False, proportionate=False,
+              workspace=None):
+    switches = (humans, buffered_up_ocn, buffered_down_ocn, buffered_up_veg, buffered_down_veg, proportionate)
+    if workspace is None:
+        network = compile_flux_table(make_flux_table(*switches))
+        step = make_step(network)
+        # one row per year, one column per reservoir
+        state = np.zeros((n_iterations, len(reservoirs)))
+    else:
+        if n_iterations > len(workspace.state):
+            raise ValueError('the workspace only has room for {} years, not {}'.format(len(workspace.state), n_iterations))
+        network, step = workspace.network_and_step(switches)
+        state = workspace.state[:n_iterations]
+    state[0] = initial_state(humans)
+    fluxes = np.zeros(len(network.names))
+    if kernels.use_jit():
+        fluxes, imbalance = kernels.carbon_steps(state, *step.arrays)
+        np.maximum(step.imbalance, imbalance, out=step.imbalance)
+    else:
+        for ii in range(1, n_iterations):
+            fluxes = step(state[ii-1], state[ii])
+    profiling.count('carbon.steps', max(n_iterations-1, 0))
+
+    check_conservation(step)
+    return CarbonResult(*state.T, dict(zip(network.names, fluxes)))
+
+# The widget only has 64 scenarios (emissions on/off, four buffering switches,
+# constant or proportionate fluxes), so each one is run once and remembered.
+# cached_run_model.cache_info() has the hit and miss counts.
+@lru_cache(maxsize=64)
+def cached_run_model(humans, n_iterations, buffered_up_ocn, buffered_down_ocn, buffered_up_veg, buffered_down_veg, proportionate):
+    result = run_model(humans, n_iterations, buffered_up_ocn, buffered_down_ocn, buffered_up_veg, buffered_down_veg, proportionate)
+    # everyone who asks for this scenario shares the result, so nobody gets to change it
+    for reservoir in result[:-1]:
+        reservoir.flags.writeable = False
+    return result._replace(fluxes=MappingProxyType(result.fluxes))
+
+def run_scenario(humans=True, n_iterations = 1000, buffered_up_ocn=False, buffered_down_ocn=False, buffered_up_veg=False, buffered_down_veg=False, proportionate=False):
+    # run_model through the cache. the switches are turned into plain bools first so
+    # that, say, 1 and True and np.True_ are the same scenario. the result is read-only.
+    return cached_run_model(bool(humans), int(n_iterations), bool(buffered_up_ocn), bool(buffered_down_ocn),
+                            bool(buffered_up_veg), bool(buffered_down_veg), bool(proportionate))
+
+def warm_scenario_cache(n_iterations = 1000, background=True):
+    # run all 64 scenarios into the cache, in a background thread unless told not to.
+    # returns the thread (already finished if background=False).
+    def warm():
+        for switches in product((True, False), repeat=6):
+            run_scenario(switches[0], n_iterations, *switches[1:])
+    thread = threading.Thread(target=warm, name='warm_scenario_cache', daemon=True)
+    if background:
+        thread.start()
+    else:
+        thread.run()
+    return thread
+
+# one piece of a streamed run: the year at the end of each window of `stride` years,
+# the state in that year, and (if asked for) the minimum, maximum and mean of each
+# reservoir over the window, each as an (n_rows, n_reservoirs) array; plus the fluxes
+# in the chunk's last year
+ModelChunk = namedtuple('ModelChunk', ['years', 'state', 'minimum', 'maximum', 'mean', 'fluxes'])
+
+def stream_model(humans=True, n_iterations = 1000, buffered_up_ocn=False, buffered_down_ocn=False, buffered_up_veg=False, buffered_down_veg=False, proportionate=False,
+                 stride=1, chunk_size=1000, summaries=False):
+    # run_model in bounded memory, for runs too long to keep every year. yields
+    # ModelChunks of up to chunk_size rows as the run goes, one row per `stride`
+    # years. with stride=1 that's every year; with stride=n_iterations it's just the
+    # final state. the window summaries cost a little extra, so they're off by default.
+    network = compile_flux_table(make_flux_table(humans, buffered_up_ocn, buffered_down_ocn,
+                                                 buffered_up_veg, buffered_down_veg, proportionate))
+    step = make_step(network)
+    n_reservoirs = len(reservoirs)
+    state = initial_state(humans)
+    new_state = np.zeros(n_reservoirs)
+    fluxes = np.zeros(len(network.names))
+
+    def new_chunk(first_year):
+        # room for the rest of the run, or a full chunk, whichever is smaller
+        rows = min(chunk_size, -(-(n_iterations-first_year) // stride))
+        if summaries:
+            return [np.zeros(rows, dtype=int)] + [np.zeros((rows, n_reservoirs)) for ii in range(4)]
+        return [np.zeros(rows, dtype=int), np.zeros((rows, n_reservoirs)), None, None, None]
+
+    chunk, row = new_chunk(0), 0
+    lowest, highest, total = state.copy(), state.copy(), np.zeros(n_reservoirs)
+    counted = 0 # steps already reported to profiling
+    for year in range(n_iterations):
+        if year > 0:
+            fluxes = step(state, new_state)
+            state, new_state = new_state, state
+        in_window = year % stride
+        if summaries:
+            if in_window == 0:
+                lowest[:] = state
+                highest[:] = state
+                total[:] = 0.
+            np.minimum(lowest, state, out=lowest)
+            np.maximum(highest, state, out=highest)
+            total += state
+
+        if in_window == stride-1 or year == n_iterations-1:
+            chunk[0][row] = year
+            chunk[1][row] = state
+            if summaries:
+                chunk[2][row] = lowest
+                chunk[3][row] = highest
+                chunk[4][row] = total/(in_window+1)
+            row += 1
+            if row == len(chunk[0]):
+                profiling.count('carbon.steps', year - counted)
+                counted = year
+                check_conservation(step)
+                yield ModelChunk(*chunk, dict(zip(network.names, fluxes.copy())))
+                if year < n_iterations-1:
+                    chunk, row = new_chunk(year+1), 0
+
+# the on/off switches run_model takes, and their defaults
+switch_defaults = dict(humans=True, buffered_up_ocn=False, buffered_down_ocn=False,
+                       buffered_up_veg=False, buffered_down_veg=False, proportionate=False)
+
+# what run_ensemble hands back: the simulation years that were kept, every member's
+# reservoirs as a (n_members, n_years, n_reservoirs) array, {percentile: (n_years,
+# n_reservoirs) array} across the members, and each member's fluxes in the last
+# simulated year (keyed by name, one value per member), and the most memory the run
+# needed per member (bytes, leaving out the few hundred kB that don't grow with the
+# ensemble)
+CarbonEnsemble = namedtuple('CarbonEnsemble', ['years', 'state', 'percentiles', 'fluxes', 'bytes_per_member'])
+
+# how far float32 ensembles may drift from float64 per 1000 years simulated, relative
+# to each reservoir's largest value and to the largest flux (the README has the
+# measured errors)
+float32_rtol = dict(state=1e-4, fluxes=1e-4)
+setup_block = 1024 # members whose float64 flux tables are built at a time
+
+def run_ensemble(n_iterations = 1000, years=None, percentiles=(5, 50, 95), dtype=float, **members):
+    # run many versions of the model side by side. members can hold any of run_model's
+    # switches (humans, buffered_up_ocn, ..., proportionate) and any of the names in
+    # constant_names (atmosphere_a_0, sfc2deep_n, ...), each either a single value for
+    # everybody or an array with one value per member. years picks which simulation
+    # years to keep (all of them by default). dtype is float (float64) or np.float32.
+    unknown = set(members) - set(switch_defaults) - set(constant_names)
+    if unknown:
+        raise TypeError('unknown ensemble setting(s): ' + ', '.join(sorted(unknown)))
+    shape = np.broadcast_shapes(*[np.shape(value) for value in members.values()])
+    n_members = int(np.prod(shape))
+    members = {name: np.broadcast_to(value, shape).ravel() for name, value in members.items()}
+    switches = np.column_stack([np.broadcast_to(members.get(name, default), (n_members,)).astype(bool)
+                                for name, default in switch_defaults.items()])
+    overrides = {name: value for name, value in members.items() if name in constant_names}
+    if years is None:
+        years = np.arange(n_iterations)
+    years = np.asarray(years)
+    if np.any((years < 0) | (years >= n_iterations) | (years != np.round(years))):
+        raise ValueError('years must be whole numbers from 0 to n_iterations-1 ({})'.format(n_iterations-1))
+
+    # same bookkeeping as run_model, except that every flux without limits is an
+    # affine function of the state, so those are folded into one matrix per member.
+    # that also means carbon conservation can be checked once, for all states,
+    # instead of every year. which fluxes have limits is the same for every setting.
+    template = compile_flux_table(make_flux_table())
+    n_fluxes, n_reservoirs = len(template.names), len(reservoirs)
+    limited = np.flatnonzero(np.isfinite(template.lower) | np.isfinite(template.upper))
+    free = np.flatnonzero(~(np.isfinite(template.lower) | np.isfinite(template.upper)))
+    conservation = np.vstack([template.river_incidence,
+                              template.incidence.sum(axis=0) + template.river_incidence + template.outside_incidence])
+    imbalance = np.max(np.abs(conservation[:, limited]), initial=0.)
+
+    # each combination of switches has its own flux rules, so build the flux table
+    # once per combination (at most 64) with that group's constants. the tables are
+    # float64, so they're built a block of members at a time and copied into arrays
+    # of the working dtype; conservation is checked on the float64 ones. members go
+    # on the last axis of the matrices, which keeps the yearly products fast.
+    state = np.zeros((n_reservoirs, n_members), dtype=dtype)
+    offset = np.zeros((n_members, n_fluxes), dtype=dtype)
+    slope = np.zeros((n_members, n_fluxes, n_reservoirs), dtype=dtype)
+    free_matrix = np.zeros((n_reservoirs, n_reservoirs, n_members), dtype=dtype)
+    free_offset = np.zeros((n_reservoirs, n_members), dtype=dtype)
+    scratch = 0
+    combos, group = np.unique(switches, axis=0, return_inverse=True)
+    for gg, combo in enumerate(combos):
+        in_group = np.flatnonzero(group.ravel() == gg)
+        for block in np.array_split(in_group, -(-len(in_group)//setup_block)):
+            constants = model_constants(**{name: value[block] for name, value in overrides.items()})
+            network = compile_flux_table(make_flux_table(*combo, constants=constants))
+            network_slope = np.broadcast_to(network.slope, (len(block), n_fluxes, n_reservoirs))
+            network_offset = np.broadcast_to(network.offset, (len(block), n_fluxes))
+            imbalance = max(imbalance, np.max(np.abs(conservation[:, free] @ network_slope[:, free])),
+                            np.max(np.abs(network_offset[:, free] @ conservation[:, free].T)))
+            block_matrix = network.incidence[:, free] @ network_slope[:, free]
+            state[:, block] = np.broadcast_to(initial_state(combo[0], constants), (len(block), n_reservoirs)).T
+            offset[block] = network_offset
+            slope[block] = network_slope
+            free_matrix[..., block] = block_matrix.transpose(2, 1, 0)
+            free_offset[:, block] = (network_offset[:, free] @ network.incidence[:, free].T).T
+            in_constants = sum(np.size(value) for value in constants.values())*8
+            scratch = max(scratch, in_constants + 2*(network.offset.nbytes + network.slope.nbytes + block_matrix.nbytes))
+    if imbalance > 1e-9:
+        raise RuntimeError('carbon is not conserved (off by up to {:.3g})'.format(imbalance))
+    limited_slope = np.ascontiguousarray(slope[:, limited].transpose(1, 2, 0))
+    limited_offset = np.ascontiguousarray(offset[:, limited].T)
+    limited_incidence = template.incidence[:, limited].astype(dtype)
+    lower = template.lower[limited, np.newaxis].astype(dtype)
+    upper = template.upper[limited, np.newaxis].astype(dtype)
+
+    # every year is worked out in these, so the loop allocates nothing
+    kept = np.zeros((len(years), n_reservoirs, n_members), dtype=dtype)
+    slots = [np.flatnonzero(years == ii) for ii in range(n_iterations)]
+    previous, following = state.copy(), np.zeros_like(state)
+    change = np.zeros_like(state)
+    limited_fluxes = np.zeros((len(limited), n_members), dtype=dtype)
+    limited_change = np.zeros_like(state)
+    kept[slots[0]] = state
+    for ii in range(1, n_iterations):
+        np.einsum('rnm,rm->nm', free_matrix, state, out=change)
+        change += free_offset
+        np.einsum('lrm,rm->lm', limited_slope, state, out=limited_fluxes)
+        limited_fluxes += limited_offset
+        np.maximum(limited_fluxes, lower, out=limited_fluxes)
+        np.minimum(limited_fluxes, upper, out=limited_fluxes)
+        np.matmul(limited_incidence, limited_fluxes, out=limited_change)
+        change += limited_change
+        np.add(state, change, out=following)
+        previous, state, following = state, following, previous
+        if len(slots[ii]):
+            kept[slots[ii]] = state
+    profiling.count('carbon.member_steps', n_members*max(n_iterations-1, 0))
+
+    # everything above stays until the end. on top of it, the peak is either the
+    # float64 tables of a block while setting up, or the last year's fluxes (twice,
+    # while they're worked out) and a sorted copy of the kept years for percentiles
+    arrays = (offset, slope, free_matrix, free_offset, limited_slope, limited_offset, kept,
+              state, previous, following, change, limited_fluxes, limited_change)
+    inputs = switches.nbytes + group.nbytes + sum(value.nbytes for value in members.values())
+    finish = 2*offset.nbytes + (kept.nbytes if len(percentiles) else 0)
+    held = inputs + sum(array.nbytes for array in arrays) + max(scratch, finish)
+    bytes_per_member = held // max(n_members, 1)
+
+    fluxes = offset + np.einsum('mfr,rm->mf', slope, previous)
+    fluxes[:, limited] = np.minimum(np.maximum(fluxes[:, limited], lower.T), upper.T)
+    if n_iterations < 2:
+        fluxes[:] = 0.
+    # (np.percentile sorts a copy of kept even when there are no percentiles to take)
+    levels = np.percentile(kept, percentiles, axis=2) if len(percentiles) else []
+    return CarbonEnsemble(years, kept.transpose(2, 0, 1), dict(zip(percentiles, levels)),
+                          dict(zip(template.names, fluxes.T)), bytes_per_member)
+
+# the constants that set the fluxes (everything but the starting reservoirs, and
+# rivers_n, which follows its parts)
+flux_constant_names = [name for name in constant_names if not name.endswith('_0') and name != 'rivers_n']
+
+# what carbon_sensitivity hands back: the kept years, every point's unperturbed run as
+# a (n_points, n_years, n_reservoirs) array (points shaped like the broadcast inputs),
+# d(reservoir)/d(constant) as (..., n_years, n_reservoirs, n_constants), and the
+# constants in the order of that last axis
+CarbonSensitivity = namedtuple('CarbonSensitivity', ['years', 'state', 'jacobian', 'constants'])
+
+def carbon_sensitivity(n_iterations = 1000, years=None, constants=None, rel_step=1e-5, **members):
+    # how every reservoir in every kept year responds to each of `constants` (by
+    # default flux_constant_names), at each point given by members (switches and
+    # constants, as for run_ensemble). each point gets two extra members per constant,
+    # nudged up and down by rel_step of its value, and they all run side by side in
+    # one run_ensemble pass: central differences without a run_model call per nudge.
+    constants = flux_constant_names if constants is None else list(constants)
+    unknown = set(constants) - set(constant_names)
+    if unknown:
+        raise TypeError('unknown model constant(s): ' + ', '.join(sorted(unknown)))
+    shape = np.broadcast_shapes(*[np.shape(value) for value in members.values()])
+    n_points = int(np.prod(shape))
+    points = {name: np.broadcast_to(value, shape).ravel() for name, value in members.items()}
+    defaults = model_constants()
+
+    # each point's members: the unperturbed run, then up and down for each constant
+    n_columns = 2*len(constants) + 1
+    batch = {name: np.repeat(value, n_columns) for name, value in points.items()}
+    steps = np.zeros((n_points, len(constants)))
+    for kk, name in enumerate(constants):
+        base = np.broadcast_to(np.asarray(points.get(name, defaults[name]), dtype=float), (n_points,))
+        steps[:, kk] = rel_step*np.where(base != 0., np.abs(base), 1.)
+        values = np.repeat(base[:, np.newaxis], n_columns, axis=1)
+        values[:, 1+2*kk] += steps[:, kk]
+        values[:, 2+2*kk] -= steps[:, kk]
+        batch[name] = values.ravel()
+
+    ensemble = run_ensemble(n_iterations, years, percentiles=(), **batch)
+    n_years = len(ensemble.years)
+    state = ensemble.state.reshape(n_points, n_columns, n_years, len(reservoirs))
+    jacobian = (state[:, 1::2] - state[:, 2::2])/(2*steps[:, :, np.newaxis, np.newaxis])
+    return CarbonSensitivity(ensemble.years, state[:, 0].reshape(shape + (n_years, len(reservoirs))),
+                             np.moveaxis(jacobian, 1, -1).reshape(shape + (n_years, len(reservoirs), len(constants))),
+                             constants)
+
+def affine_map(network, state):
+    # the model's yearly step as one (n+1)x(n+1) matrix acting on [state, 1], valid
+    # for as long as every limited flux stays on the same side of its limits as it
+    # is at this state (below them, between them, or above them)
+    fluxes = network.offset + network.slope @ state
+    regime = np.where(fluxes < network.lower, -1, np.where(fluxes > network.upper, 1, 0))
+    offset = np.where(regime < 0, network.lower, np.where(regime > 0, network.upper, network.offset))
+    slope = np.where(regime[:, np.newaxis] != 0, 0., network.slope)
+    n_reservoirs = len(reservoirs)
+    step = np.eye(n_reservoirs+1)
+    step[:n_reservoirs, :n_reservoirs] += network.incidence @ slope
+    step[:n_reservoirs, n_reservoirs] = network.incidence @ offset
+    return step, regime
+
+def same_regime(network, state, regime):
+    fluxes = network.offset + network.slope @ state
+    now = np.where(fluxes < network.lower, -1, np.where(fluxes > network.upper, 1, 0))
+    return np.array_equal(now, regime)
+
+def solve_model(years, humans=True, buffered_up_ocn=False, buffered_down_ocn=False, buffered_up_veg=False, buffered_down_veg=False, proportionate=False):
+    # run_model without the year-by-year loop, for the state at any set of years.
+    # between switching points (the fossil fuel running out) a year of the model is
+    # x[t+1] = A @ x[t] + b, so the model jumps ahead with powers of that matrix and
+    # only steps through the years where a flux switches. this assumes each limited
+    # flux crosses a limit at most once per stretch, which is true for the fuel.
+    # returns a CarbonResult whose arrays line up with years, with the fluxes of the
+    # year before the last one asked for (matching run_model(n_iterations=max(years)+1)).
+    network = compile_flux_table(make_flux_table(humans, buffered_up_ocn, buffered_down_ocn,
+                                                 buffered_up_veg, buffered_down_veg, proportionate))
+    years = np.asarray(years, dtype=int)
+    if np.any(years < 0):
+        raise ValueError('years must not be negative')
+    n_reservoirs = len(reservoirs)
+    state = np.append(initial_state(humans), 1.)
+    now = 0
+    kept = np.zeros((len(years), n_reservoirs))
+    last_fluxes = np.zeros(len(network.names))
+
+    # visit the years in order, plus the year before the last for the fluxes
+    targets = sorted(set(years.tolist()) | {max(years.max(initial=0)-1, 0)})
+    reached = {}
+    for target in targets:
+        while now < target:
+            step, regime = affine_map(network, state[:n_reservoirs])
+            # how many steps can we take with this matrix? all the states we step
+            # from have to be in the same regime as this one
+            n_steps = target - now
+            if not same_regime(network, (np.linalg.matrix_power(step, n_steps-1) @ state)[:n_reservoirs], regime):
+                good, bad = 1, n_steps
+                while bad - good > 1:
+                    middle = (good + bad) // 2
+                    if same_regime(network, (np.linalg.matrix_power(step, middle-1) @ state)[:n_reservoirs], regime):
+                        good = middle
+                    else:
+                        bad = middle
+                n_steps = good
+            state = np.linalg.matrix_power(step, n_steps) @ state
+            now += n_steps
+            profiling.count('carbon.matrix_jumps')
+        reached[target] = state[:n_reservoirs].copy()
+
+    for yy, year in enumerate(years):
+        kept[yy] = reached[year]
+    if years.max(initial=0) >= 1:
+        previous = reached[years.max()-1]
+        last_fluxes = np.clip(network.offset + network.slope @ previous, network.lower, network.upper)
+    return CarbonResult(*kept.T, dict(zip(network.names, last_fluxes)))
+
+def model_rates(network):
+    # the model as a differential equation: rates(state) is d(state)/dt in PgC/yr,
+    # and jacobian(state) is its derivative. run_model is this equation stepped with
+    # forward Euler and a 1-year step. the fluxes are affine between their limits,
+    # so the jacobian is exact.
+    def rates(state):
+        return network.incidence @ np.clip(network.offset + network.slope @ state, network.lower, network.upper)
+
+    def jacobian(state):
+        fluxes = network.offset + network.slope @ state
+        inside = (fluxes >= network.lower) & (fluxes <= network.upper)
+        return network.incidence @ (network.slope * inside[:, np.newaxis])
+
+    return rates, jacobian
+
+# each integrator takes one step of size h from state and returns the new state and
+# an estimate of the error made (None for the fixed-step ones)
+def euler_step(rates, jacobian, state, h):
+    return state + h*rates(state), None
+
+def rk4_step(rates, jacobian, state, h):
+    k1 = rates(state)
+    k2 = rates(state + h/2*k1)
+    k3 = rates(state + h/2*k2)
+    k4 = rates(state + h*k3)
+    return state + h/6*(k1 + 2*k2 + 2*k3 + k4), None
+
+# Dormand-Prince 5(4) coefficients
+dopri_a = [[],
+           [1/5],
+           [3/40, 9/40],
+           [44/45, -56/15, 32/9],
+           [19372/6561, -25360/2187, 64448/6561, -212/729],
+           [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+           [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]
+dopri_b = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0])
+dopri_b_low = np.array([5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40])
+
+def dopri_step(rates, jacobian, state, h):
+    # fifth-order Runge-Kutta with an embedded fourth-order one for the error
+    k = []
+    for a in dopri_a:
+        k.append(rates(state + h*sum(aa*kk for aa, kk in zip(a, k))))
+    k = np.array(k)
+    return state + h*(dopri_b @ k), h*((dopri_b - dopri_b_low) @ k)
+
+def backward_euler_step(rates, jacobian, state, h):
+    # implicit Euler: solve new = state + h*rates(new) with Newton's method. it stays
+    # stable however big the step, which is what the slow deep ocean needs. the error
+    # estimate is the difference from the trapezoidal rule.
+    new = state + h*rates(state)
+    identity = np.eye(len(state))
+    for ii in range(20):
+        delta = np.linalg.solve(identity - h*jacobian(new), new - state - h*rates(new))
+        new = new - delta
+        if np.max(np.abs(delta)) <= 1e-12*(1. + np.max(np.abs(new))):
+            break
+    return new, h/2*(rates(new) - rates(state))
+
+# TR-BDF2 coefficients: a trapezoidal step to gamma*h, then BDF2 to h, written as
+# a Runge-Kutta method whose implicit stages all have diag on the diagonal
+trbdf2_gamma = 2. - np.sqrt(2.)
+trbdf2_diag = trbdf2_gamma/2.
+trbdf2_w = np.sqrt(2.)/4.
+# the second-order answer minus the embedded third-order one (Hosea and Shampine)
+trbdf2_error = np.array([trbdf2_w - (1.-trbdf2_w)/3., trbdf2_w - (3.*trbdf2_w+1.)/3., 2./3.*trbdf2_diag])
+
+def implicit_stage(rates, jacobian, rhs, guess, dh):
+    # solve new - dh*rates(new) = rhs with Newton's method. the rates are affine
+    # between the flux limits, so it's exact in one go unless a limit is crossed.
+    new = guess
+    identity = np.eye(len(rhs))
+    for ii in range(20):
+        delta = np.linalg.solve(identity - dh*jacobian(new), new - dh*rates(new) - rhs)
+        new = new - delta
+        if np.max(np.abs(delta)) <= 1e-12*(1. + np.max(np.abs(new))):
+            break
+    return new
+
+def trbdf2_step(rates, jacobian, state, h):
+    # TR-BDF2: second order and L-stable, so it takes the fast modes (vegetation,
+    # the fuel running out) in its stride and then strides across the slow deep
+    # ocean in steps of hundreds of years. the error estimate is filtered through
+    # the stage matrix, as usual for stiff problems, so it doesn't blow up on them.
+    k1 = rates(state)
+    middle = implicit_stage(rates, jacobian, state + trbdf2_diag*h*k1, state + trbdf2_gamma*h*k1, trbdf2_diag*h)
+    k2 = rates(middle)
+    new = implicit_stage(rates, jacobian, state + trbdf2_w*h*(k1 + k2), middle + (1.-trbdf2_gamma)*h*k2, trbdf2_diag*h)
+    k3 = rates(new)
+    error = h*(trbdf2_error @ np.array([k1, k2, k3]))
+    return new, np.linalg.solve(np.eye(len(state)) - trbdf2_diag*h*jacobian(state), error)
+
+# name: (step function, order of its error estimate, or None for a fixed step)
+integrators = {'euler': (euler_step, None),
+               'rk4': (rk4_step, None),
+               'rk45': (dopri_step, 5),
+               'implicit': (backward_euler_step, 2),
+               'trbdf2': (trbdf2_step, 3)}
+# runs at least this many years long use trbdf2 unless told otherwise; rk45 takes
+# fewer steps for shorter ones. (out to 1e6 years trbdf2 takes 30-430 steps, where
+# rk45 takes one every three years or so and implicit Euler 2500-5300.)
+long_horizon = 1000 # years
+
+# what integrate_model hands back: like CarbonResult, plus how many steps it took
+# and how many it had to throw away and redo smaller
+IntegratedResult = namedtuple('IntegratedResult', reservoirs + ['fluxes', 'n_steps', 'n_rejected'])
+
+def integrate_model(years, method=None, humans=True, buffered_up_ocn=False, buffered_down_ocn=False, buffered_up_veg=False, buffered_down_veg=False, proportionate=False,
+                    step=1., max_step=np.inf, rtol=1e-6, atol=1e-6):
+    # solve the model as a differential equation (see model_rates) with one of the
+    # integrators above. the fixed-step ones always use `step` years; the adaptive
+    # ones start from it and then pick their own steps to keep the error within
+    # atol + rtol*|state| PgC per step. the state at each of years is interpolated
+    # from the steps on either side of it. 'euler' with step=1 is run_model. by default
+    # the method is trbdf2 for runs of long_horizon years or more and rk45 otherwise.
+    years = np.asarray(years, dtype=float)
+    if method is None:
+        method = 'trbdf2' if years.max(initial=0.) >= long_horizon else 'rk45'
+    if method not in integrators:
+        raise ValueError('method must be one of ' + ', '.join(integrators))
+    stepper, order = integrators[method]
+    network = compile_flux_table(make_flux_table(humans, buffered_up_ocn, buffered_down_ocn,
+                                                 buffered_up_veg, buffered_down_veg, proportionate))
+    rates, jacobian = model_rates(network)
+    kept = np.zeros((len(years), len(reservoirs)))
+    wanted = np.argsort(years)
+    end = years.max(initial=0.)
+
+    now = 0.
+    state = initial_state(humans)
+    now_rates = rates(state)
+    n_steps = n_rejected = 0
+    next_wanted = 0
+    while next_wanted < len(wanted) and years[wanted[next_wanted]] <= now:
+        kept[wanted[next_wanted]] = state
+        next_wanted += 1
+    while now < end:
+        h = min(step, max_step, end - now)
+        new, error = stepper(rates, jacobian, state, h)
+        if order is not None:
+            scale = atol + rtol*np.maximum(np.abs(state), np.abs(new))
+            error = np.max(np.abs(error)/scale)
+            growth = 5. if error == 0 else 0.9*error**(-1./order)
+            if error > 1.:
+                step = h*max(0.2, growth)
+                n_rejected += 1
+                continue
+            step = h*min(5., growth)
+        new_rates = rates(new)
+        n_steps += 1
+
+        # cubic Hermite interpolation to any years inside this step
+        while next_wanted < len(wanted) and years[wanted[next_wanted]] <= now + h:
+            s = (years[wanted[next_wanted]] - now)/h
+            kept[wanted[next_wanted]] = ((2*s**3 - 3*s**2 + 1)*state + (s**3 - 2*s**2 + s)*h*now_rates
+                                         + (-2*s**3 + 3*s**2)*new + (s**3 - s**2)*h*new_rates)
+            next_wanted += 1
+        now, state, now_rates = now + h, new, new_rates
+
+    fluxes = np.clip(network.offset + network.slope @ state, network.lower, network.upper)
+    profiling.count('carbon.steps', n_steps)
+    profiling.count('carbon.rejected_steps', n_rejected)
+    return IntegratedResult(*kept.T, dict(zip(network.names, fluxes)), n_steps, n_rejected)
@@ -0,0 +1,176 @@
+# The carbon model's plots: the reservoir lines next to the flux drawing.
+import os
+import numpy as np
+from functools import lru_cache
+from math import isclose
+from matplotlib import gridspec
+from matplotlib import pyplot as plt
+from matplotlib import image as mpimg
+from carbon_core import model_constants, deep_ocean_0
+from plot_tools import Blitter
+import profiling
+
+# the pre-industrial constants the arrows are compared against (name + '_n')
+preindustrial = model_constants()
+
+def flux_arrow_style(flux, piflux):
+    # arrow width scales with the flux; red if it's grown since pre-industrial times,
+    # gray if it's shrunk, black if it's about the same
+    base_width=5
+    arrow_width = base_width*flux/piflux
+    if isclose(flux, piflux, rel_tol=1e-3, abs_tol=1e-3):
+        color='black'  
+    elif flux>piflux:
+        color='red'
+    else:
+        color='gray'
+    return arrow_width, color
+
+def net_up_arrow_geometry(y0, dy, flux, piflux):
+    # like flux_arrow_style, but the arrow flips to point down when the net flux does
+    arrow_width = 5*flux/piflux
+    color = flux_arrow_style(abs(flux), abs(piflux))[1]
+    if flux < 0:
+        y0 += dy - 25
+        dy *= -1
+    return y0, dy, arrow_width, color
+
+def flux_arrow(ax, x0, y0, dx, dy, flux, piflux):
+    arrow_width, color = flux_arrow_style(flux, piflux)
+    return ax.arrow(x0, y0, dx, dy, width=arrow_width, head_width=15, ec=color, fc=color)
+
+def net_up_arrow(ax, x0, y0, dy, flux, piflux):
+    y0, dy, arrow_width, color = net_up_arrow_geometry(y0, dy, flux, piflux)
+    return ax.arrow(x0, y0, 0, dy, width=arrow_width, head_width=15, ec=color, fc=color)
+
+# reservoir lines: name, color, label, label height above the line's start,
+# label alignment, and what to subtract before plotting
+reservoir_lines = [
+    ('atmosphere', 'turquoise', 'atmosphere', 0, 'top', 0),
+    ('fuel_reserves', 'black', 'coal, oil, and gas reserves', 0, 'top', 0),
+    ('vegetation', 'forestgreen', 'vegetation', 0, 'top', 0),
+    ('deep_ocean', 'navy', r'deep ocean change', 0, 'baseline', deep_ocean_0),
+    ('soil', 'brown', 'soil', 20, 'baseline', 0),
+    ('permafrost', 'darkseagreen', 'permafrost', 0, 'top', 0),
+    ('surface_ocean', 'royalblue', 'surface ocean', 0, 'top', 0),
+    ('marine_biota', 'tan', 'marine biota', 0, 'top', 0),
+    ('dissolved_organic', 'gray', 'dissolved organic', 0, 'top', 0),
+]
+
+# flux arrows on the drawing: flux name, x0, y0, dx, dy (pixels)
+flux_arrows = [
+    ('atm2sfc', 307, 201, 0, 244), # atmos -> ocean
+    ('sfc2atm', 368, 470, 0, -244), # ocean -> atmos
+    ('sfc2deep', 251, 545, 0, 60), # surface -> deep
+    ('deep2sfc', 277, 625, 0, -60), # deep -> surface
+    ('deep2rock', 264, 686, 0, 56), # deep to floor
+    ('sfc2bio', 350, 510, 38, 0), # surface ocean -> marine biota
+    ('bio2sfc', 410, 530, -38, 0), # marine biota -> surface ocean
+    ('bio2deep', 414, 548, -94, 75), # marine biota -> deep sea
+    ('bio2doc', 447, 551, 0, 74), # marine biota -> DOC
+    ('doc2deep', 400, 667, -91, 0), # DOC -> deep sea
+    ('rvr2sea', 546, 546, -34, 0), # river emptying
+    ('burial', 635, 543, 0, 27), # river burial
+    ('rivr2atm', 627, 521, 0, -380), # river outgassing
+    ('atm2veg', 905, 192, 0, 250), # photosynthesis
+    ('veg2atm', 984, 460, 0, -250), # respiration
+    ('volc', 1050, 227, 0, -100), # volcanism
+    ('atm2rivr', 1147, 180, 0, 256), # wind weathering
+    ('rock2rivr', 1147, 476, -40, -20), # stream weathering
+    ('soil2rivr', 864, 445, -20, 0), # soil export to rivers weathering
+]
+
+# net up arrows: outgoing flux, incoming flux, x0, y0, dy
+net_arrows = [
+    ('sfc2atm', 'atm2sfc', 339, 170, -55), # net ocean -> atmos
+    ('veg2atm', 'atm2veg', 951, 148, -23), # net photo/resp
+]
+
+# found next to this file, wherever it's run from
+drawing_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ccycle_drawing.png')
+
+@lru_cache()
+def load_drawing(filename=drawing_file):
+    # the background drawing only needs decoding once
+    with profiling.span('image.load'):
+        return mpimg.imread(filename)
+
+class CarbonRenderer:
+    # draws the reservoir plot and the flux drawing once, then each update only
+    # moves and recolors the same lines, labels and arrows. where the backend can
+    # blit and the reservoir axes keep their limits, only the changed artists are
+    # redrawn over a saved background.
+    def __init__(self, ax0, ax1, drawing=drawing_file):
+        self.ax0, self.ax1 = ax0, ax1
+
+        self.lines, self.labels = {}, {}
+        for name, color, label, label_offset, va, subtract in reservoir_lines:
+            self.lines[name], = ax0.plot([], [], color=color)
+            self.labels[name] = ax0.text(0, 0, label, color=color, va=va)
+        #ax0.set_yscale('log')
+        #ax0.set_ylim(300, 4000)
+        ax0.set_ylabel(r'Petagrams Carbon (PgC), or 10$^{15}$g')
+        ax0.set_xlabel('simulation year')
+        ax0.set_title('Carbon reservoirs over time')
+
+        ax1.imshow(load_drawing(drawing), aspect='equal')
+        ax1.set_axis_off()
+        self.arrows = {}
+        for name, x0, y0, dx, dy in flux_arrows:
+            self.arrows[name] = ax1.arrow(x0, y0, dx, dy, width=5, head_width=15)
+        self.net_arrows = []
+        for up, down, x0, y0, dy in net_arrows:
+            self.net_arrows.append(ax1.arrow(x0, y0, 0, dy, width=5, head_width=15))
+        base_width=5
+        headwidth=14
+        self.human_arrows = [
+            ax1.arrow(758, 521, 0, -380, width=base_width, head_width=headwidth, ec='red', fc='red'), # emissions
+            ax1.arrow(820, 431, 0, -290, width=base_width, head_width=headwidth, ec='red', fc='red'), # net land use change
+        ]
+        # placed by hand: matplotlib's own placement goes wrong when the title is blitted
+        self.title = ax1.set_title('', y=1.0)
+        self.blitter = Blitter(ax0.figure.canvas,
+                               list(self.lines.values()) + list(self.labels.values()) + list(self.arrows.values())
+                               + self.net_arrows + self.human_arrows + [self.title])
+
+    def update(self, result, humans=True):
+        fluxes = result.fluxes
+        with profiling.span('plot.lines'):
+            for name, color, label, label_offset, va, subtract in reservoir_lines:
+                values = getattr(result, name) - subtract
+                self.lines[name].set_data(np.arange(len(values)), values)
+                self.labels[name].set_position((0, values[0] + label_offset))
+            old_limits = self.ax0.get_xlim(), self.ax0.get_ylim()
+            self.ax0.relim()
+            self.ax0.autoscale_view()
+            if (self.ax0.get_xlim(), self.ax0.get_ylim()) != old_limits:
+                self.blitter.forget()
+
+        with profiling.span('plot.arrows'):
+            for name, x0, y0, dx, dy in flux_arrows:
+                arrow_width, color = flux_arrow_style(fluxes[name], preindustrial[name + '_n'])
+                self.arrows[name].set_data(width=arrow_width)
+                self.arrows[name].set_color(color)
+            for arrow, (up, down, x0, y0, dy) in zip(self.net_arrows, net_arrows):
+                y0, dy, arrow_width, color = net_up_arrow_geometry(y0, dy, fluxes[up]-fluxes[down],
+                                                                   preindustrial[up + '_n']-preindustrial[down + '_n'])
+                arrow.set_data(y=y0, dy=dy, width=arrow_width)
+                arrow.set_color(color)
+            for arrow in self.human_arrows:
+                arrow.set_visible(humans)
+        self.title.set_text('Carbon fluxes compared to pre-industrial\nat simulation year {}.'.format(len(result.atmosphere)))
+        self.blitter.redraw()
+
+def plot_carbon_model(ax0, ax1, result, humans=True):
+    # one-off plot of a run; the widget keeps a CarbonRenderer around instead
+    renderer = CarbonRenderer(ax0, ax1)
+    renderer.update(result, humans)
+    return renderer
+
+def carbon_figure():
+    # the widget's figure: reservoirs on the left, the drawing on the right
+    fig = plt.figure(figsize=(9,4))
+    spec = gridspec.GridSpec(ncols=2, nrows=1, width_ratios=[1, 3], wspace=0, hspace=0)
+    ax0 = fig.add_subplot(spec[0])
+    ax1 = fig.add_subplot(spec[1])
+    return fig, CarbonRenderer(ax0, ax1)
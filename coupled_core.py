@@ -0,0 +1,81 @@
+# The carbon cycle driving the greenhouse atmosphere: each year the carbon model's
+# atmosphere reservoir sets the emissivity of the atmosphere's layers, and the
+# column responds. Only needs numpy, like the models it couples.
+import numpy as np
+import warnings
+from collections import namedtuple
+from carbon_core import (compile_flux_table, make_flux_table, make_step, initial_state, check_conservation,
+                         reservoirs, CarbonResult, atmosphere_n_0)
+from atmos_core import AtmosWorkspace, step_atmos_column, implicit_atmos_step, solve_atmos_model, calc_fluxes
+
+def co2_emissivity(atmosphere, emiss_pi=0.2, per_doubling=0.05, atmosphere_pi=atmosphere_n_0):
+    # the greenhouse effect grows with the log of CO2: emiss_pi at the pre-industrial
+    # atmosphere (PgC), plus per_doubling for every doubling. kept between 0 and 1.
+    # the numbers are picked to give a sensible-looking response, not fitted to anything.
+    return np.clip(emiss_pi + per_doubling*np.log2(atmosphere/atmosphere_pi), 0., 1.)
+
+# what run_coupled_model hands back: the carbon run (as run_model gives it), and for
+# every year the emissivity, surface and layer temperatures, the top-of-atmosphere
+# imbalance (W/m^2) and how many atmosphere steps were taken
+CoupledResult = namedtuple('CoupledResult', ['carbon', 'emiss_atm', 't_surf', 't_atm', 'toa_imbalance', 'atmos_steps'])
+
+def run_coupled_model(humans=True, n_iterations = 1000, buffered_up_ocn=False, buffered_down_ocn=False, buffered_up_veg=False, buffered_down_veg=False, proportionate=False,
+                      albedo=0.3, solar_constant = 1.36e3/4., n_layers = 10, emiss_pi=0.2, per_doubling=0.05,
+                      atmosphere='implicit', days_per_year=365, tol=1e-3):
+    # step the carbon model a year at a time and let the atmosphere follow. the column
+    # starts in equilibrium with the first year's CO2 (one linear solve, no spin-up)
+    # and after that carries on from last year's temperatures, so it lags behind the
+    # CO2 the way the layers' heat capacity says it should. how it's advanced each year:
+    #   'implicit'     one year-long backward-Euler step (one linear solve per year)
+    #   'daily'        up to days_per_year one-day steps like run_atmos_model's,
+    #                  stopping early once it's within tol of balance (slow)
+    #   'equilibrium'  no lag: straight to each year's equilibrium
+    # everything is written into arrays allocated once, up front.
+    if atmosphere not in ('implicit', 'daily', 'equilibrium'):
+        raise ValueError('unknown atmosphere stepping: {}'.format(atmosphere))
+    network = compile_flux_table(make_flux_table(humans, buffered_up_ocn, buffered_down_ocn,
+                                                 buffered_up_veg, buffered_down_veg, proportionate))
+    step = make_step(network)
+    sun_reflected = solar_constant*albedo
+    heat_from_the_sun = solar_constant - sun_reflected
+
+    state = np.zeros((n_iterations, len(reservoirs)))
+    emiss_atm = np.zeros(n_iterations)
+    t_surf = np.zeros(n_iterations)
+    t_atm = np.zeros((n_iterations, n_layers))
+    toa_imbalance = np.zeros(n_iterations)
+    atmos_steps = np.zeros(n_iterations, dtype=int)
+    # the column's emissivity, transmission and stepping arrays, reused every year
+    workspace = AtmosWorkspace(n_layers)
+    fluxes = np.zeros(len(network.names))
+
+    with warnings.catch_warnings():
+        # the imbalance is in the result; no need to warn about every year
+        warnings.simplefilter('ignore')
+        for ii in range(n_iterations):
+            if ii == 0:
+                state[0] = initial_state(humans)
+            else:
+                fluxes = step(state[ii-1], state[ii])
+            emiss_atm[ii] = co2_emissivity(state[ii, 0], emiss_pi, per_doubling)
+            if ii == 0 or atmosphere == 'equilibrium':
+                column = solve_atmos_model(albedo, solar_constant, emiss_atm[ii], n_layers)
+                t_surf[ii], t_atm[ii] = column.t_surf, column.t_atm
+                toa_imbalance[ii] = heat_from_the_sun - column.heat_upward[-1]
+                continue
+            # warm start: this year's column is last year's, moved on a year
+            emissivity, transmission = workspace.set_emissivity(emiss_atm[ii])
+            if atmosphere == 'implicit':
+                t_surf[ii], t_atm[ii] = implicit_atmos_step(t_surf[ii-1], t_atm[ii-1], emissivity, transmission,
+                                                            heat_from_the_sun, days_per_year*24*60*60.)
+                heat_upward, heat_dnward = calc_fluxes(t_surf[ii], t_atm[ii], emissivity, transmission)
+                atmos_steps[ii] = 1
+            else:
+                t_atm[ii] = t_atm[ii-1]
+                t_surf[ii], heat_upward, heat_dnward, atmos_steps[ii], converged = step_atmos_column(
+                    t_surf[ii-1], t_atm[ii], emissivity, transmission, heat_from_the_sun, days_per_year, tol, workspace)
+            toa_imbalance[ii] = heat_from_the_sun - heat_upward[-1]
+
+    check_conservation(step)
+    return CoupledResult(CarbonResult(*state.T, dict(zip(network.names, fluxes))),
+                         emiss_atm, t_surf, t_atm, toa_imbalance, atmos_steps)
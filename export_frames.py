@@ -0,0 +1,209 @@
+# Save the widgets' plots as numbered PNG frames or an animation, without a notebook
+# (on the Agg backend), for videos and reports.
+#
+#     python export_frames.py carbon frames/ --set humans=true --set n_iterations=500
+#     python export_frames.py atmos layers.gif --vary n_layers 0 25
+#     python export_frames.py planet planet.mp4 --vary distance 0.1 50 --frames 1000
+#
+# carbon frames step through a run year by year (every year, or --frames of them
+# spread evenly); atmos and planet frames sweep one parameter from one value to
+# another (--vary). --set fixes any of the other parameters:
+#   carbon: run_model's switches and n_iterations
+#   atmos:  albedo, solar_constant, emiss_atm, n_layers (solved for equilibrium)
+#   planet: distance (AU), T_star, r_star (solar radii), albedo, emissivity
+# The output is a directory of frame_00000.png, frame_00001.png, ..., or a .gif
+# (written with Pillow) or .mp4 (needs ffmpeg on the PATH).
+#
+# The model is run once, up front, and every frame is a slice of that run. The
+# frames are drawn by a process pool; each worker makes one figure (and decodes
+# the carbon drawing once) and redraws it for every frame it's given. The carbon
+# plot's axes stay at the whole run's limits instead of growing with the lines.
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from planet_core import earth_dist, r_sun, calc_temp_from_sun, catalog_defaults
+from atmos_core import run_atmos_ensemble
+from carbon_core import (run_model, compile_flux_table, make_flux_table, flux_history, switch_defaults,
+                         CarbonResult)
+
+def sweep(vary, n_frames, default_frames):
+    # (name, values) for a --vary name start stop
+    name, start, stop = vary
+    return name, np.linspace(start, stop, default_frames if n_frames is None else n_frames)
+
+def simulate_carbon(n_frames=None, vary=None, n_iterations=200, **switches):
+    if vary is not None:
+        raise ValueError('carbon frames go through the years of one run; there is nothing to vary')
+    if n_iterations < 2:
+        # the first frame is after the first year, so there'd be nothing to draw
+        raise ValueError('carbon frames need n_iterations of at least 2, not {}'.format(n_iterations))
+    switches = dict(switch_defaults, **switches)
+    result = run_model(n_iterations=n_iterations, **switches)
+    state = np.stack(result[:-1], axis=1)
+    network = compile_flux_table(make_flux_table(**switches))
+    # the first frame is after the first year, when there are fluxes to draw
+    n_years = np.arange(2, n_iterations+1) if n_frames is None else np.linspace(2, n_iterations, n_frames).round().astype(int)
+    return dict(n_frames=len(n_years), state=state, fluxes=flux_history(network, state), names=network.names,
+                n_years=n_years, humans=switches['humans'])
+
+def fix_carbon_axes(renderer, run):
+    # hold the reservoir axes at the whole run's limits, so they don't jump about from
+    # frame to frame (and everything else only has to be drawn once)
+    draw_carbon_frame(renderer, run, run['n_frames']-1)
+    renderer.ax0.autoscale(False)
+
+def draw_carbon_frame(renderer, run, ii):
+    n_years = run['n_years'][ii]
+    result = CarbonResult(*run['state'][:n_years].T, dict(zip(run['names'], run['fluxes'][n_years-2])))
+    renderer.update(result, run['humans'])
+
+atmos_defaults = dict(albedo=0.3, solar_constant=1.36e3/4., emiss_atm=0.2, n_layers=10)
+
+def simulate_atmos(n_frames=None, vary=('n_layers', 0, 25), **settings):
+    # by default one frame per layer count, or 100 frames for the others
+    name, values = sweep(vary, n_frames, int(abs(vary[2]-vary[1]))+1 if vary[0] == 'n_layers' else 100)
+    if name not in atmos_defaults:
+        raise ValueError('unknown atmos parameter: {}'.format(name))
+    params = dict(atmos_defaults, **settings)
+    params[name] = values.round().astype(int) if name == 'n_layers' else values
+    params = dict(zip(params, np.broadcast_arrays(*params.values())))
+    result = run_atmos_ensemble(**params)
+    return dict(result._asdict(), n_frames=len(values), albedo=params['albedo'],
+                solar_constant=params['solar_constant'], n_layers=params['n_layers'])
+
+def draw_atmos_frame(renderer, run, ii):
+    n_layers = run['n_layers'][ii]
+    result = (run['t_surf'][ii], run['t_atm'][ii, :n_layers],
+              run['heat_upward'][ii, :n_layers+1], run['heat_dnward'][ii, :n_layers+1])
+    renderer.update(result, run['albedo'][ii], run['solar_constant'][ii])
+
+def simulate_planet(n_frames=None, vary=('distance', 0.1, 50), **settings):
+    name, values = sweep(vary, n_frames, 500)
+    if name != 'distance':
+        raise ValueError('planet frames can only vary the distance')
+    settings = dict(catalog_defaults, **settings)
+    return dict(n_frames=len(values), distance=values, t_model=calc_temp_from_sun(
+        earth_dist*values, settings['T_star'], settings['r_star']*r_sun, settings['albedo'], settings['emissivity']))
+
+def draw_planet_frame(renderer, run, ii):
+    renderer.update(run['distance'][ii], run['t_model'][ii])
+
+# model name: (function that runs the model once for all the frames, module with the
+# widget's figure, function setting the figure up for a run (or None), function
+# drawing frame ii of the run on that figure's renderer)
+exporters = {
+    'carbon': (simulate_carbon, 'carbon_plot', fix_carbon_axes, draw_carbon_frame),
+    'atmos': (simulate_atmos, 'atmos_plot', None, draw_atmos_frame),
+    'planet': (simulate_planet, 'planet_plot', None, draw_planet_frame),
+}
+
+# each worker's figure, renderer and copy of the run
+worker = {}
+
+def start_worker(model, run, dpi):
+    import importlib
+    import matplotlib
+    matplotlib.use('Agg')
+    # the plotting modules import pyplot, so only after the backend is set
+    simulate, module, prepare, draw = exporters[model]
+    figure, renderer = getattr(importlib.import_module(module), model + '_figure')()
+    figure.set_dpi(dpi)
+    if prepare is not None:
+        prepare(renderer, run)
+    worker.update(run=run, draw=draw, figure=figure, renderer=renderer)
+
+def draw_frames(frames, pattern):
+    # Agg can blit too: the renderer's Blitter keeps the still parts of the figure
+    # and only redraws what moves, so each frame is read straight off the canvas
+    # instead of redrawing all of it with savefig
+    from PIL import Image
+    canvas = worker['figure'].canvas
+    for ii in frames:
+        worker['draw'](worker['renderer'], worker['run'], ii)
+        Image.fromarray(np.asarray(canvas.buffer_rgba())).save(pattern.format(ii), compress_level=1)
+    return len(frames)
+
+def export_frames(model, output, n_frames=None, vary=None, settings=None, fps=20, dpi=100,
+                  max_workers=None, progress=None):
+    # run the model once and write its frames to output (a directory, .gif or .mp4).
+    # progress(n_done, n_frames) is called as batches of frames finish. returns the
+    # number of frames written.
+    simulate = exporters[model][0]
+    extension = os.path.splitext(output)[1].lower()
+    if extension not in ('', '.gif', '.mp4'):
+        raise ValueError('write frames to a directory, a .gif or an .mp4, not {}'.format(extension))
+    if extension == '.mp4' and shutil.which('ffmpeg') is None:
+        raise RuntimeError('writing .mp4 needs ffmpeg on the PATH; try a .gif or a directory')
+    kwargs = dict(settings or {})
+    if vary is not None:
+        kwargs['vary'] = vary
+    run = simulate(n_frames, **kwargs)
+    total = run['n_frames']
+    if extension:
+        directory = tempfile.mkdtemp()
+    else:
+        directory = output
+        os.makedirs(directory, exist_ok=True)
+    pattern = os.path.join(directory, 'frame_{:05d}.png')
+
+    try:
+        # enough batches to keep every worker busy to the end, but each one big enough
+        # that a worker spends its time drawing rather than waiting for work
+        n_workers = max_workers or os.cpu_count() or 1
+        batches = [batch for batch in np.array_split(np.arange(total), 4*n_workers) if len(batch)]
+        n_done = 0
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=start_worker, initargs=(model, run, dpi)) as pool:
+            for future in as_completed([pool.submit(draw_frames, batch, pattern) for batch in batches]):
+                n_done += future.result()
+                if progress is not None:
+                    progress(n_done, total)
+
+        frames = [pattern.format(ii) for ii in range(total)]
+        if extension == '.gif':
+            from PIL import Image
+            first = Image.open(frames[0])
+            # one frame in memory at a time
+            first.save(output, save_all=True, append_images=(Image.open(frame) for frame in frames[1:]),
+                       duration=1000./fps, loop=0)
+        elif extension == '.mp4':
+            subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-framerate', str(fps), '-i', pattern.replace('{:05d}', '%05d'),
+                            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', output], check=True)
+    finally:
+        if extension:
+            shutil.rmtree(directory)
+    return total
+
+def parse_setting(text):
+    # name=value, where value is JSON (true, 0.3, ...) or else a plain string
+    name, value = text.split('=', 1)
+    try:
+        return name, json.loads(value)
+    except ValueError:
+        return name, value
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Save frames of a model run, or a sweep of one parameter, without a notebook.')
+    parser.add_argument('model', choices=list(exporters))
+    parser.add_argument('output', help='a directory for PNG frames, or a .gif or .mp4 file')
+    parser.add_argument('--frames', type=int, default=None, help='how many frames (default: every year, or a model-dependent number for sweeps)')
+    parser.add_argument('--vary', nargs=3, metavar=('NAME', 'START', 'STOP'), help='sweep NAME from START to STOP')
+    parser.add_argument('--set', action='append', default=[], type=parse_setting, metavar='NAME=VALUE', help='fix a parameter (repeatable)')
+    parser.add_argument('--fps', type=float, default=20, help='frames per second for .gif and .mp4 (default 20)')
+    parser.add_argument('--dpi', type=float, default=100)
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: one per core)')
+    args = parser.parse_args()
+    if args.frames is not None and args.frames < 1:
+        parser.error('--frames must be at least 1')
+    vary = None if args.vary is None else (args.vary[0], float(args.vary[1]), float(args.vary[2]))
+    try:
+        n_frames = export_frames(args.model, args.output, args.frames, vary, dict(args.set), args.fps, args.dpi, args.workers,
+                                 progress=lambda n_done, total: print('{}/{} frames'.format(n_done, total), flush=True))
+    except ValueError as error:
+        # settings the model can't make frames from
+        parser.error(str(error))
+    print('wrote {} frames to {}'.format(n_frames, args.output))
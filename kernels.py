@@ -0,0 +1,108 @@
+# Compiled versions of the two time-stepping loops: the atmosphere's day-by-day
+# column (atmos_core.step_atmos_column) and the carbon model's year-by-year update
+# (carbon_core.run_model). Both are small recurrences that numpy can't vectorize
+# across steps, so for one run they spend most of their time in Python overhead.
+# Written as plain loops over scalars, they compile well with numba.
+#
+# The numpy code in the *_core modules is the reference and the default. To use
+# these instead, install numba and either set SIMPLE_MODELS_BACKEND=numba in the
+# environment or call kernels.set_backend('numba'). Compiled code is cached on disk
+# (in __pycache__), so only the very first run pays for compiling. Without numba the
+# numpy code is used. tests/test_kernels.py checks that the two agree.
+import os
+import warnings
+import numpy as np
+
+try:
+    import numba
+    jit = numba.njit(cache=True)
+except ImportError:
+    numba = None
+    def jit(function):
+        # same code, uncompiled: slow, but the tests can still run it
+        return function
+
+backend_names = ('numpy', 'numba')
+backend = 'numpy'
+
+def set_backend(name):
+    global backend
+    if name not in backend_names:
+        raise ValueError('unknown backend {!r}; choose from {}'.format(name, ', '.join(backend_names)))
+    if name == 'numba' and numba is None:
+        warnings.warn('numba is not installed; using the numpy backend')
+        name = 'numpy'
+    backend = name
+
+def use_jit():
+    return backend == 'numba'
+
+@jit
+def atmos_column_steps(t_surf, t_atm, emissivity, surf_up, trans_up, trans_dn, heat_from_the_sun,
+                       sb_const, heat_capacity_ground, heat_capacity_atm, n_seconds, n_steps, tol):
+    # step_atmos_column's loop. t_atm is updated in place; tol < 0 means never stop early.
+    n_layers = t_atm.shape[0]
+    emit = np.zeros(n_layers)
+    heat_upward = np.zeros(n_layers+1)
+    heat_dnward = np.zeros(n_layers+1)
+    n_taken = 0
+    converged = False
+    for jj in range(n_steps):
+        for ii in range(n_layers):
+            emit[ii] = sb_const*emissivity[ii]*t_atm[ii]**4.
+        surf_emit = sb_const*t_surf**4.
+        for kk in range(n_layers+1):
+            # only layers below level kk send radiation up to it, only those above send it down
+            up = 0.
+            for ii in range(kk):
+                up += trans_up[kk, ii]*emit[ii]
+            dn = 0.
+            for ii in range(kk, n_layers):
+                dn += trans_dn[kk, ii]*emit[ii]
+            heat_upward[kk] = surf_up[kk]*surf_emit + up
+            heat_dnward[kk] = dn
+
+        dt_surf = (heat_from_the_sun + heat_dnward[0] - heat_upward[0]) / heat_capacity_ground * n_seconds
+        t_surf += dt_surf
+        dt_max = abs(dt_surf)
+        for ii in range(n_layers):
+            dt_atm = (heat_upward[ii]-heat_upward[ii+1]+heat_dnward[ii+1]-heat_dnward[ii]) / heat_capacity_atm * n_seconds
+            t_atm[ii] += dt_atm
+            dt_max = max(dt_max, abs(dt_atm))
+        n_taken = jj+1
+        if tol >= 0. and abs(heat_from_the_sun - heat_upward[n_layers]) < tol and dt_max < tol:
+            converged = True
+            break
+    return t_surf, heat_upward, heat_dnward, n_taken, converged
+
+@jit
+def carbon_steps(state, slope, offset, limited, lower, upper, to_nodes, n_reservoirs):
+    # run_model's loop: fills state[1:] from state[0], and returns the last year's
+    # fluxes and the worst conservation error (as make_step's step.imbalance)
+    n_iterations, n_state = state.shape
+    n_fluxes = offset.shape[0]
+    n_nodes = to_nodes.shape[0]
+    fluxes = np.zeros(n_fluxes)
+    change = np.zeros(n_nodes)
+    imbalance = np.zeros(n_nodes - n_reservoirs)
+    for year in range(1, n_iterations):
+        for ff in range(n_fluxes):
+            total = 0.
+            for rr in range(n_state):
+                total += slope[ff, rr]*state[year-1, rr]
+            fluxes[ff] = total + offset[ff]
+        for ll in range(limited.shape[0]):
+            ff = limited[ll]
+            fluxes[ff] = min(max(fluxes[ff], lower[ll]), upper[ll])
+        for nn in range(n_nodes):
+            total = 0.
+            for ff in range(n_fluxes):
+                total += to_nodes[nn, ff]*fluxes[ff]
+            change[nn] = total
+        for rr in range(n_state):
+            state[year, rr] = state[year-1, rr] + change[rr]
+        for cc in range(n_nodes - n_reservoirs):
+            imbalance[cc] = max(imbalance[cc], abs(change[n_reservoirs+cc]))
+    return fluxes, imbalance
+
+set_backend(os.environ.get('SIMPLE_MODELS_BACKEND', 'numpy'))
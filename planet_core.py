@@ -0,0 +1,87 @@
+# The blackbody planet model, and catalogs of planets to run it over.
+import numpy as np
+from itertools import islice
+
+# a bunch of numbers the model relies on
+earth_dist = 1.496e11 # average meters to the earth from the sun
+T_sun = 5772. # effective temperature of the sun in Kelvins
+r_sun = 6.96e8 # average radius of the sun, about 696,000,000 kilometers
+
+# the inverse-square law. works on arrays too, and the star, albedo and emissivity
+# can be given per planet (the defaults are the sun and a perfect blackbody)
+def calc_temp_from_sun(distance, T_star=T_sun, r_star=r_sun, albedo=0., emissivity=1.):
+    t_bb = T_star * ((1.-albedo)/emissivity * r_star**2./(distance)**2./4.)**0.25
+    return(t_bb)
+
+# A catalog is a dict of equal-length columns (numpy arrays):
+#   distance    orbital distance in AU (required)
+#   T_star      star's effective temperature in Kelvins (default: the sun's)
+#   r_star      star's radius in solar radii (default: 1)
+#   albedo      fraction of starlight reflected (default: 0)
+#   emissivity  (default: 1)
+#   t_obs       observed temperature in Kelvins, if known (default: nan)
+#   name        optional
+catalog_defaults = dict(T_star=T_sun, r_star=1., albedo=0., emissivity=1., t_obs=np.nan)
+
+# the planets (and Pluto) as a catalog
+solar_system = dict(
+    name=np.array(['Mercury', 'Venus', 'Earth', 'Mars', 'Jupiter', 'Saturn', 'Uranus', 'Neptune', 'Pluto']),
+    distance=np.array([0.4, 0.72, 1, 1.52, 5.2, 9.5, 19.8, 30, 49]),
+    t_obs=np.array([398.15, 744.15, 289.15, 245.15, 165.15, 135.15, 78.15, 72.15, 40]),
+)
+
+def catalog_from_array(table):
+    # turn a structured array (what np.genfromtxt and np.load give back) into columns
+    return {name: np.asarray(table[name]) for name in table.dtype.names}
+
+def blank_to_nan(text):
+    return float(text) if text.strip() else np.nan
+
+def read_csv_catalog(lines):
+    # a .csv catalog (a filename, or a header line and rows) as columns. the numeric
+    # columns are always read as floats, with nan for blank cells; left to itself,
+    # genfromtxt reads a blank as -1 in a column of whole numbers, and a column with
+    # nothing in it as False.
+    converters = {name: blank_to_nan for name in ['distance'] + list(catalog_defaults)}
+    return catalog_from_array(np.atleast_1d(np.genfromtxt(lines, delimiter=',', names=True, dtype=None,
+                                                          encoding='utf-8', converters=converters)))
+
+def load_catalog(filename):
+    # read a whole catalog from a .csv file with a header row, or from a .npy/.npz
+    # file holding a structured array or one array per column
+    if filename.endswith('.npz'):
+        with np.load(filename) as columns:
+            return {name: columns[name] for name in columns.files}
+    if filename.endswith('.npy'):
+        return catalog_from_array(np.load(filename))
+    return read_csv_catalog(filename)
+
+def evaluate_catalog(catalog):
+    # blackbody temperature for every row at once, and how far off it is from the
+    # observed temperature (nan where there's no observation)
+    n_rows = len(catalog['distance'])
+    columns = {name: np.broadcast_to(catalog.get(name, default), (n_rows,))
+               for name, default in catalog_defaults.items()}
+    t_model = calc_temp_from_sun(earth_dist*np.asarray(catalog['distance'], dtype=float),
+                                 columns['T_star'], r_sun*columns['r_star'],
+                                 columns['albedo'], columns['emissivity'])
+    return dict(t_model=t_model, residual=t_model - columns['t_obs'])
+
+def stream_catalog(filename, chunk_rows=100000):
+    # evaluate_catalog for catalogs too big to load at once. yields (chunk, result)
+    # pairs of up to chunk_rows rows. .npy files are memory-mapped; .csv files are
+    # read a chunk of lines at a time.
+    if filename.endswith('.npy'):
+        table = np.load(filename, mmap_mode='r')
+        for start in range(0, len(table), chunk_rows):
+            chunk = catalog_from_array(table[start:start+chunk_rows])
+            yield chunk, evaluate_catalog(chunk)
+        return
+    with open(filename) as lines:
+        header = next(lines)
+        while True:
+            rows = list(islice(lines, chunk_rows))
+            if not rows:
+                return
+            chunk = read_csv_catalog([header] + rows)
+            yield chunk, evaluate_catalog(chunk)
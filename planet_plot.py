@@ -0,0 +1,39 @@
+# The planet model's plot: temperature against distance, with the solar system marked.
+from matplotlib import pyplot as plt
+import numpy as np
+from planet_core import earth_dist, calc_temp_from_sun, solar_system
+from plot_tools import Blitter
+
+# how to draw each planet in solar_system: color and label
+planet_styles = [('gray', '.M'), ('gold', '.V'), ('blue', '.E'), ('red', '.M'), ('orange', '.J'),
+                 ('maroon', '.S'), ('teal', '.U'), ('blue', '.N'), ('steelblue', '.P')]
+
+class PlanetRenderer:
+    # Everything that doesn't move is drawn once: the planets, their labels, and the
+    # model's answer for every distance from min_AU to max_AU. Each update only
+    # moves the model circle.
+    def __init__(self, ax, min_AU=0.1, max_AU=50):
+        ax.set_ylim(30, 900)
+        ax.set_xlim(0.1, 50)
+        ax.set_xlabel('Distance from the sun in Astronomical Units (AU)')
+        ax.set_ylabel('Temperature in Kelvins (K)')
+        ax.set_title('Temperature Model output with planets (and Pluto)')
+        ax.set_yscale('log')
+        ax.set_yticks((30, 60, 90, 300, 600, 900), labels=('30', '60', '90', '300', '600', '900'))
+
+        ax.scatter(solar_system['distance'], solar_system['t_obs'], c=[style[0] for style in planet_styles], marker='.')
+        for AU, temp, (color, label) in zip(solar_system['distance'], solar_system['t_obs'], planet_styles):
+            ax.text(AU, temp, label, color=color)
+        curve_AU = np.linspace(min_AU, max_AU, 500)
+        ax.plot(curve_AU, calc_temp_from_sun(earth_dist*curve_AU), color='lightgray', zorder=0)
+        self.model_circle, = ax.plot([], [], 'ok', fillstyle='none')
+        self.blitter = Blitter(ax.figure.canvas, [self.model_circle])
+
+    def update(self, AU, planet_temp):
+        self.model_circle.set_data([AU], [planet_temp])
+        self.blitter.redraw()
+
+def planet_figure(min_AU=0.1, max_AU=50):
+    # the widget's figure
+    fig, ax = plt.subplots(figsize=(6, 4))
+    return fig, PlanetRenderer(ax, min_AU, max_AU)
@@ -0,0 +1,107 @@
+# Helpers shared by the widget modules' plotting and callbacks.
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import profiling
+
+class Blitter:
+    # redraws a few changing artists over a saved copy of everything else, on
+    # backends that can blit; anywhere else it just asks for a normal redraw.
+    # call forget() whenever something outside `artists` changes (e.g. axis limits).
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.artists = list(artists)
+        self.background = None
+        canvas.mpl_connect('resize_event', self.forget)
+
+    def forget(self, event=None):
+        self.background = None
+
+    def redraw(self):
+        if not self.canvas.supports_blit:
+            self.canvas.draw_idle()
+            return
+        figure = self.canvas.figure
+        if self.background is None:
+            # draw everything except the artists that change, and keep that
+            with profiling.span('plot.background'):
+                visible = [artist.get_visible() for artist in self.artists]
+                for artist in self.artists:
+                    artist.set_visible(False)
+                self.canvas.draw()
+                self.background = self.canvas.copy_from_bbox(figure.bbox)
+                for artist, was_visible in zip(self.artists, visible):
+                    artist.set_visible(was_visible)
+        with profiling.span('plot.blit'):
+            self.canvas.restore_region(self.background)
+            # in the order a full draw would use (artists made earlier go first)
+            for artist in sorted(self.artists, key=lambda artist: artist.get_zorder()):
+                figure.draw_artist(artist)
+            self.canvas.blit(figure.bbox)
+
+class BackgroundUpdater:
+    # runs compute(*args, **kwargs) on a worker thread and hands the result to
+    # render(result) back on the kernel's own thread, so a slow model run doesn't
+    # freeze the notebook. requests that come in less than `delay` seconds apart are
+    # merged into the last one, and a newer request cancels an older run (or, if it's
+    # already running, throws its result away), so only the latest result is drawn.
+    # busy(True)/busy(False) is called around each run, e.g. to show a progress label.
+    # outside an event loop (a plain script) it just computes and renders right away.
+    # with profiling on, each update that gets drawn is recorded under `name`.
+    def __init__(self, compute, render, delay=0.25, busy=None, name='update'):
+        self.name = name
+        self.compute = compute
+        self.render = render
+        self.delay = delay
+        self.busy = busy if busy is not None else (lambda running: None)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.latest = 0 # numbers the requests; only the newest one gets rendered
+        self.timer = None
+        self.task = None
+
+    def request(self, *args, **kwargs):
+        self.latest += 1
+        record = profiling.start_record(self.name)
+        job = partial(self.timed_compute, record, partial(self.compute, *args, **kwargs))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.busy(True)
+            try:
+                self.timed_render(record, job())
+            finally:
+                self.busy(False)
+            return
+        self.busy(True)
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = loop.call_later(self.delay, self.start, loop, self.latest, record, job)
+
+    def timed_compute(self, record, job):
+        with profiling.recording(record), profiling.span('compute'):
+            return job()
+
+    def timed_render(self, record, result):
+        with profiling.recording(record), profiling.span('render'):
+            self.render(result)
+        profiling.finish_record(record)
+
+    def start(self, loop, number, record, job):
+        self.timer = None
+        if self.task is not None:
+            self.task.cancel()
+        self.task = loop.create_task(self.run(loop, number, record, job))
+
+    async def run(self, loop, number, record, job):
+        try:
+            result = await loop.run_in_executor(self.executor, job)
+            if number == self.latest:
+                self.timed_render(record, result)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            traceback.print_exc()
+        finally:
+            if number == self.latest:
+                self.busy(False)
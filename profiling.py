@@ -0,0 +1,98 @@
+# Opt-in timing for the models and widgets, to find out where a slow update goes.
+# Off by default, and then every hook is a no-op; turn it on with profiling.enable().
+#
+# While it's on:
+#   - every widget update leaves a record in profiling.records: a dict with the
+#     update's name, when it happened (time), how long each phase took (spans,
+#     seconds; 'total' is from the click to the finished drawing) and what the
+#     kernels counted (counters, e.g. atmos.steps)
+#   - profiling.summary() gives count, mean and 95th percentile for every span name
+#
+# Only the standard library, so the *_core modules can use it without new dependencies.
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+
+enabled = False
+history = 1000 # records and timing samples to keep per name
+records = deque(maxlen=history)
+samples = defaultdict(lambda: deque(maxlen=history))
+counters = defaultdict(int)
+local = threading.local() # the record being filled in on this thread, if any
+null = nullcontext()
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+def reset():
+    records.clear()
+    samples.clear()
+    counters.clear()
+
+def start_record(name):
+    # a new per-update record, or None when profiling is off
+    if not enabled:
+        return None
+    return dict(name=name, time=time.time(), started=time.perf_counter(), spans={}, counters={})
+
+def finish_record(record):
+    if record is None:
+        return
+    add_time('total', time.perf_counter() - record['started'], record)
+    records.append(record)
+
+@contextmanager
+def filling(record):
+    previous = getattr(local, 'record', None)
+    local.record = record
+    try:
+        yield
+    finally:
+        local.record = previous
+
+def recording(record):
+    # spans and counts on this thread go into record while this is open
+    if record is None:
+        return null
+    return filling(record)
+
+@contextmanager
+def timing(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start)
+
+def span(name):
+    # with profiling.span('plot.arrows'): ... times the block
+    if not enabled:
+        return null
+    return timing(name)
+
+def add_time(name, seconds, record=None):
+    samples[name].append(seconds)
+    record = record if record is not None else getattr(local, 'record', None)
+    if record is not None:
+        record['spans'][name] = record['spans'].get(name, 0.) + seconds
+
+def count(name, n=1):
+    # kernels count their steps once per run, not once per step
+    if not enabled:
+        return
+    counters[name] += n
+    record = getattr(local, 'record', None)
+    if record is not None:
+        record['counters'][name] = record['counters'].get(name, 0) + n
+
+def summary():
+    # {span name: dict(count, mean, p95)} over the last `history` samples of each
+    table = {}
+    for name, times in samples.items():
+        ordered = sorted(times)
+        table[name] = dict(count=len(ordered), mean=sum(ordered)/len(ordered),
+                           p95=ordered[math.ceil(0.95*len(ordered)) - 1])
+    return table
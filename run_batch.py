@@ -0,0 +1,201 @@
+# Big overnight sweeps of any of the three models, fanned out over a process pool.
+#
+#     python run_batch.py spec.json results/ [--workers N]
+#
+# The spec is a JSON file saying which model to run and over which parameters:
+#
+#     {"model": "atmos",
+#      "fixed": {"solar_constant": 340},
+#      "grid": {"albedo": [0.1, 0.2, 0.3], "n_layers": [0, 1, 2, 5, 10]},
+#      "sample": {"emiss_atm": [0.1, 1.0]}, "n_samples": 100, "seed": 0,
+#      "chunk_size": 1000}
+#
+# "grid" runs every combination of the listed values; "sample" draws n_samples
+# values uniformly between each pair of bounds, and every sample is run at every
+# grid point. the parameters are:
+#   planet: distance (AU), T_star, r_star (solar radii), albedo, emissivity, t_obs
+#   atmos:  albedo, solar_constant, emiss_atm, n_layers (solved for equilibrium)
+#   carbon: run_model's switches and any of carbon_core.constant_names, plus
+#           "n_iterations" and "years" (which years to keep) at the top of the spec
+# "dtype": "float32" runs atmos and carbon sweeps in float32 and stores them that
+# way, for half the memory and disk (the README says how accurate that is).
+#
+# The results directory holds spec.json, params.npy (one row of parameters per
+# run: the index to search), one .npy per output field with a row per run, and
+# done.npy, which records the chunks that have been finished. Running the same spec
+# into the same directory again picks up where an interrupted sweep left off.
+# open_store and select_rows read the results back through memory maps, so
+# only the rows you look at are loaded.
+import argparse
+import json
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from planet_core import evaluate_catalog, catalog_from_array, catalog_defaults
+from atmos_core import run_atmos_ensemble
+from carbon_core import run_ensemble, reservoirs, make_flux_table, switch_defaults, constant_names
+
+def run_planet_chunk(params, spec):
+    result = evaluate_catalog(catalog_from_array(params))
+    return dict(t_model=result['t_model'], residual=result['residual'])
+
+def planet_fields(params, spec):
+    return dict(t_model=(float, ()), residual=(float, ()))
+
+atmos_names = ['albedo', 'solar_constant', 'emiss_atm', 'n_layers']
+
+def run_atmos_chunk(params, spec):
+    with warnings.catch_warnings():
+        # the converged field says which ones didn't make it
+        warnings.simplefilter('ignore')
+        result = run_atmos_ensemble(**{name: params[name] for name in atmos_names if name in params.dtype.names},
+                                    dtype=spec.get('dtype', 'float64'))
+    return {name: getattr(result, name) for name in ['t_surf', 't_atm', 'heat_upward', 'heat_dnward', 'residual', 'converged']}
+
+def atmos_fields(params, spec):
+    n_max = int(params['n_layers'].max(initial=0)) if 'n_layers' in params.dtype.names else 10
+    dtype = spec.get('dtype', 'float64')
+    return dict(t_surf=(dtype, ()), t_atm=(dtype, (n_max,)), heat_upward=(dtype, (n_max+1,)),
+                heat_dnward=(dtype, (n_max+1,)), residual=(dtype, ()), converged=(bool, ()))
+
+def carbon_years(spec):
+    return np.arange(spec.get('n_iterations', 1000)) if spec.get('years') is None else np.asarray(spec['years'])
+
+def run_carbon_chunk(params, spec):
+    # one row per run for every reservoir (a column per kept year) and every flux
+    result = run_ensemble(n_iterations=spec.get('n_iterations', 1000), years=carbon_years(spec), percentiles=(),
+                          dtype=spec.get('dtype', 'float64'), **{name: params[name] for name in params.dtype.names})
+    columns = dict(zip(reservoirs, np.moveaxis(result.state, 2, 0)))
+    columns.update(result.fluxes)
+    return columns
+
+def carbon_fields(params, spec):
+    dtype = spec.get('dtype', 'float64')
+    fields = {name: (dtype, (len(carbon_years(spec)),)) for name in reservoirs}
+    fields.update({flux.name: (dtype, ()) for flux in make_flux_table()})
+    return fields
+
+# model name: (parameters it takes, function that runs one chunk of parameter rows,
+# function giving each output field's dtype and per-row shape)
+batch_models = {
+    'planet': (['distance'] + list(catalog_defaults), run_planet_chunk, planet_fields),
+    'atmos': (atmos_names, run_atmos_chunk, atmos_fields),
+    'carbon': (list(switch_defaults) + constant_names, run_carbon_chunk, carbon_fields),
+}
+
+def make_params(spec):
+    # every run in the spec as a structured array, one field per parameter
+    names, run_chunk, fields = batch_models[spec['model']]
+    fixed, grid, sample = spec.get('fixed', {}), spec.get('grid', {}), spec.get('sample', {})
+    unknown = (set(fixed) | set(grid) | set(sample)) - set(names)
+    if unknown:
+        raise ValueError('unknown {} parameter(s): {}'.format(spec['model'], ', '.join(sorted(unknown))))
+    columns = {}
+    if grid:
+        mesh = np.meshgrid(*[np.asarray(values) for values in grid.values()], indexing='ij')
+        columns = {name: values.ravel() for name, values in zip(grid, mesh)}
+    n_grid = len(next(iter(columns.values()))) if columns else 1
+    if sample:
+        rng = np.random.default_rng(spec.get('seed'))
+        n_samples = spec.get('n_samples', 100)
+        columns = {name: np.repeat(values, n_samples) for name, values in columns.items()}
+        for name, (low, high) in sample.items():
+            columns[name] = np.tile(rng.uniform(low, high, n_samples), n_grid)
+    n_rows = len(next(iter(columns.values()))) if columns else 1
+    for name, value in fixed.items():
+        columns[name] = np.full(n_rows, value)
+    params = np.zeros(n_rows, dtype=[(name, columns[name].dtype) for name in names if name in columns])
+    for name in params.dtype.names:
+        params[name] = columns[name]
+    return params
+
+def run_batch_chunk(spec, params):
+    # what each worker does
+    return batch_models[spec['model']][1](params, spec)
+
+def start_store(spec, directory):
+    # make a new results directory for spec, or check that an existing one is for the
+    # same spec, and hand back (params, fields, done), all memory-mapped
+    spec_file = os.path.join(directory, 'spec.json')
+    if os.path.exists(spec_file):
+        with open(spec_file) as file:
+            if json.load(file) != spec:
+                raise ValueError('{} holds results for a different spec'.format(directory))
+        return open_store(directory, mode='r+')
+    os.makedirs(directory, exist_ok=True)
+    params = make_params(spec)
+    np.save(os.path.join(directory, 'params.npy'), params)
+    names, run_chunk, fields = batch_models[spec['model']]
+    for name, (dtype, shape) in fields(params, spec).items():
+        column = np.lib.format.open_memmap(os.path.join(directory, name + '.npy'), mode='w+',
+                                           dtype=dtype, shape=(len(params),) + shape)
+        if np.dtype(dtype).kind == 'f':
+            column[:] = np.nan
+        column.flush()
+    n_chunks = -(-len(params) // spec.get('chunk_size', 1000))
+    np.save(os.path.join(directory, 'done.npy'), np.zeros(n_chunks, dtype=bool))
+    # written last, so a directory with a spec.json is always complete
+    with open(spec_file, 'w') as file:
+        json.dump(spec, file, indent=1)
+    return open_store(directory, mode='r+')
+
+def open_store(directory, mode='r'):
+    # (params, {field: column}, done) for a results directory, without reading any of
+    # it into memory. rows in chunks that aren't done yet are nan (or False/0).
+    params = np.load(os.path.join(directory, 'params.npy'), mmap_mode='r')
+    done = np.load(os.path.join(directory, 'done.npy'), mmap_mode=mode)
+    fields = {}
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension == '.npy' and name not in ('params', 'done'):
+            fields[name] = np.load(os.path.join(directory, filename), mmap_mode=mode)
+    return params, fields, done
+
+def select_rows(params, **conditions):
+    # row numbers whose parameters match, e.g. select_rows(params, n_layers=5,
+    # albedo=(0.2, 0.4)): a single value has to match (to rounding), a (low, high)
+    # pair is a range with both ends included
+    keep = np.ones(len(params), dtype=bool)
+    for name, condition in conditions.items():
+        if isinstance(condition, tuple):
+            keep &= (params[name] >= condition[0]) & (params[name] <= condition[1])
+        else:
+            keep &= np.isclose(params[name], condition, rtol=1e-12, atol=0.)
+    return np.flatnonzero(keep)
+
+def run_batch(spec, directory, max_workers=None, progress=None):
+    # run (or finish running) spec into directory. chunks are handed out to a process
+    # pool, one per task, and each finished chunk is written and ticked off in
+    # done.npy before the next one is taken, so at most the chunks in flight are lost
+    # if the run is interrupted. progress(n_done, n_chunks) is called as chunks finish.
+    params, fields, done = start_store(spec, directory)
+    chunk_size = spec.get('chunk_size', 1000)
+    todo = np.flatnonzero(~done)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run_batch_chunk, spec, np.array(params[cc*chunk_size:(cc+1)*chunk_size])): cc
+                   for cc in todo}
+        for future in as_completed(futures):
+            cc = futures[future]
+            rows = slice(cc*chunk_size, (cc+1)*chunk_size)
+            for name, values in future.result().items():
+                values = np.asarray(values)
+                # atmosphere columns with fewer layers than the widest one stay nan-padded
+                fields[name][(rows,) + tuple(slice(0, nn) for nn in values.shape[1:])] = values
+                fields[name].flush()
+            done[cc] = True
+            done.flush()
+            if progress is not None:
+                progress(int(done.sum()), len(done))
+    return open_store(directory)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a sweep of one of the models over a process pool.')
+    parser.add_argument('spec', help='JSON file describing the runs')
+    parser.add_argument('directory', help='where the results go (an interrupted run here is resumed)')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: one per core)')
+    args = parser.parse_args()
+    with open(args.spec) as file:
+        spec = json.load(file)
+    run_batch(spec, args.directory, args.workers,
+              progress=lambda n_done, n_chunks: print('{}/{} chunks done'.format(n_done, n_chunks), flush=True))
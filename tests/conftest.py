@@ -0,0 +1,5 @@
+# the models are plain modules at the top of the repo
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
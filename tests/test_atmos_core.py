@@ -0,0 +1,80 @@
+import tracemalloc
+import numpy as np
+import pytest
+from atmos_core import (sb_const, calc_transmission, calc_fluxes, calc_heat_capacity, integrate_atmos_model,
+                        run_atmos_ensemble, float32_rtol)
+
+def loop_fluxes(t_surf, t_atm, emissivity):
+    # the layer-by-layer sweeps run_atmos_model used before calc_fluxes
+    n_layers = len(t_atm)
+    heat_upward = np.zeros(n_layers+1)
+    heat_dnward = np.zeros(n_layers+1)
+    heat_upward[0] = sb_const * t_surf**4.
+    for ii in range(n_layers):
+        emit_ii = sb_const*emissivity[ii]*t_atm[ii]**4.
+        heat_upward[ii+1] = heat_upward[ii] - emissivity[ii]*heat_upward[ii] + emit_ii
+    for ii in range(n_layers-1, -1, -1):
+        emit_ii = sb_const*emissivity[ii]*t_atm[ii]**4.
+        heat_dnward[ii] = heat_dnward[ii+1] - emissivity[ii]*heat_dnward[ii+1] + emit_ii
+    return heat_upward, heat_dnward
+
+def loop_model(albedo, solar_constant, emiss_atm, n_layers, n_steps):
+    # the old time stepping, one layer at a time
+    n_seconds = 60.*60.*24.
+    t_surf = 273.15
+    emissivity = np.zeros(n_layers) + emiss_atm
+    t_atm = np.zeros(n_layers) + 273.15
+    heat_capacity_ground, heat_capacity_atm = calc_heat_capacity(n_layers)
+    heat_from_the_sun = solar_constant - solar_constant*albedo
+    for jj in range(n_steps):
+        heat_upward, heat_dnward = loop_fluxes(t_surf, t_atm, emissivity)
+        t_surf += (heat_from_the_sun + heat_dnward[0] - heat_upward[0]) / heat_capacity_ground * n_seconds
+        for ii in range(n_layers):
+            t_atm[ii] += (heat_upward[ii]-heat_upward[ii+1]+heat_dnward[ii+1]-heat_dnward[ii]) / heat_capacity_atm * n_seconds
+    return t_surf, t_atm, heat_upward, heat_dnward
+
+@pytest.mark.parametrize('n_layers', [0, 1, 2, 7, 30])
+def test_fluxes_match_loops(n_layers):
+    rng = np.random.default_rng(n_layers)
+    emissivity = rng.uniform(0., 1., n_layers)
+    t_surf, t_atm = rng.uniform(200., 320.), rng.uniform(180., 300., n_layers)
+    heat_upward, heat_dnward = calc_fluxes(t_surf, t_atm, emissivity, calc_transmission(emissivity))
+    expected_up, expected_dn = loop_fluxes(t_surf, t_atm, emissivity)
+    np.testing.assert_allclose(heat_upward, expected_up, rtol=1e-12, atol=1e-10)
+    np.testing.assert_allclose(heat_dnward, expected_dn, rtol=1e-12, atol=1e-10)
+
+@pytest.mark.parametrize('n_layers', [0, 1, 5])
+def test_run_matches_loops(n_layers):
+    result = integrate_atmos_model(0.3, 1.36e3/4., 0.4, n_layers, n_steps=3000)
+    t_surf, t_atm, heat_upward, heat_dnward = loop_model(0.3, 1.36e3/4., 0.4, n_layers, 3000)
+    assert result.iterations == 3000
+    np.testing.assert_allclose(result.t_surf, t_surf, rtol=1e-10)
+    np.testing.assert_allclose(result.t_atm, t_atm, rtol=1e-10)
+    np.testing.assert_allclose(result.heat_upward, heat_upward, rtol=1e-10, atol=1e-8)
+    np.testing.assert_allclose(result.heat_dnward, heat_dnward, rtol=1e-10, atol=1e-8)
+
+@pytest.mark.parametrize('n_layers', [0, 1, 2, 5, 10, 25, 50, 100])
+def test_float32_ensemble_within_bounds(n_layers):
+    # a grid over the sliders' ranges: albedo 0-0.9, 80-200% of the solar constant,
+    # emissivity 0.1-1
+    grid = np.meshgrid(np.linspace(0., 0.9, 4), 1.36e3/4.*np.linspace(0.8, 2., 4),
+                       np.linspace(0.1, 1., 4), n_layers, indexing='ij')
+    exact = run_atmos_ensemble(*grid)
+    single = run_atmos_ensemble(*grid, dtype=np.float32)
+    assert np.all(single.converged)
+    for name, rtol in float32_rtol.items():
+        # heat_dnward at the top is exactly 0; there the absolute error is used
+        scale = np.abs(getattr(exact, name))
+        error = np.abs(getattr(single, name) - getattr(exact, name))/np.where(scale > 0, scale, 1.)
+        assert np.nanmax(error, initial=0.) <= rtol, name
+
+@pytest.mark.parametrize('n_members, n_layers', [(20000, 0), (20000, 1), (20000, 5), (2000, 25)])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_ensemble_bytes_per_member(n_members, n_layers, dtype):
+    emiss_atm = np.linspace(0.1, 1., n_members)
+    run_atmos_ensemble(emiss_atm=emiss_atm[:2], n_layers=n_layers, dtype=dtype)
+    tracemalloc.start()
+    result = run_atmos_ensemble(emiss_atm=emiss_atm, n_layers=n_layers, dtype=dtype)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert 0.9 < result.bytes_per_member*n_members/peak < 1.3
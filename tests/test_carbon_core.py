@@ -0,0 +1,141 @@
+from itertools import product
+import tracemalloc
+import numpy as np
+import pytest
+import carbon_core as c
+from carbon_core import run_model, reservoirs
+
+def branch_model(humans, n_iterations, buffered_up_ocn, buffered_down_ocn, buffered_up_veg, buffered_down_veg, proportionate):
+    # the model as it was written before the flux table: one if/else per switch,
+    # every year. returns the reservoirs (n_iterations, n_reservoirs) and the last
+    # year's fluxes.
+    state = np.zeros((n_iterations, len(reservoirs)))
+    state[0] = c.initial_state(humans)
+    for ii in range(1, n_iterations):
+        old = dict(zip(reservoirs, state[ii-1]))
+        first = dict(zip(reservoirs, state[0]))
+        f = dict(rock2rivr=c.rock2rivr_n, volc=c.volc_n)
+        if proportionate:
+            f['atm2rivr'] = c.proport(c.atmosphere_n_0, c.atm2rivr_n, old['atmosphere'])
+            f['soil2rivr'] = c.proport(c.soil_0, c.soil2rivr_n, old['soil'])
+        else:
+            f['atm2rivr'], f['soil2rivr'] = c.atm2rivr_n, c.soil2rivr_n
+        rivers = f['rock2rivr'] + f['atm2rivr'] + f['soil2rivr']
+        if proportionate:
+            f['sfc2bio'] = c.proport(first['surface_ocean'], c.sfc2bio_n, old['surface_ocean'])
+            f['bio2sfc'] = c.bio2sfc_n*f['sfc2bio']/c.sfc2bio_n
+            f['bio2doc'] = c.bio2doc_n*f['sfc2bio']/c.sfc2bio_n
+            f['bio2deep'] = c.bio2deep_n*f['sfc2bio']/c.sfc2bio_n
+            f['doc2deep'] = c.proport(c.dissolved_organic_0, c.doc2deep_n, old['dissolved_organic'])
+            f['sfc2deep'] = c.proport(first['surface_ocean'], c.sfc2deep_n, old['surface_ocean'])
+            f['deep2sfc'] = c.proport(c.deep_ocean_0, c.deep2sfc_n, old['deep_ocean'])
+            f['burial'] = c.proport(c.rivers_n, c.burial_n, rivers)
+            f['rivr2atm'] = c.proport(c.rivers_n, c.rivr2atm_n, rivers)
+            f['deep2rock'] = c.proport(c.deep_ocean_0, c.deep2rock_n, old['deep_ocean'])
+        else:
+            for name in ['sfc2bio', 'bio2sfc', 'bio2doc', 'bio2deep', 'doc2deep', 'sfc2deep', 'deep2sfc',
+                         'burial', 'rivr2atm', 'deep2rock']:
+                f[name] = getattr(c, name + '_n')
+        f['veg2soil'] = old['vegetation'] - first['vegetation']
+        f['rvr2sea'] = rivers - f['rivr2atm'] - f['burial']
+        if humans:
+            f['land_use'], f['cement'] = 1.1, 3.
+            f['fossil_fuel'] = min(max(old['fuel_reserves'], 0.), 4.8)
+            f['sfc2atm'] = (c.linear_extrap(c.surface_ocean_n_0, c.surface_ocean_a_0, old['surface_ocean'], c.sfc2atm_n, c.sfc2atm_a)
+                            if buffered_up_ocn else c.sfc2atm_a)
+            f['atm2sfc'] = (c.linear_extrap(c.atmosphere_n_0, c.atmosphere_a_0, old['atmosphere'], c.atm2sfc_n, c.atm2sfc_a)
+                            if buffered_down_ocn else c.atm2sfc_a)
+            f['veg2atm'] = (c.linear_extrap(c.vegetation_n_0, c.vegetation_a_0, old['vegetation'], c.veg2atm_n, c.veg2atm_a)
+                            if buffered_up_veg else c.veg2atm_a)
+            f['atm2veg'] = (c.linear_extrap(c.atmosphere_n_0, c.atmosphere_a_0, old['atmosphere'], c.atm2veg_n, c.atm2veg_a)
+                            if buffered_down_veg else c.atm2veg_a)
+        else:
+            f['land_use'] = f['fossil_fuel'] = f['cement'] = 0.
+            f['sfc2atm'], f['atm2sfc'], f['veg2atm'], f['atm2veg'] = c.sfc2atm_n, c.atm2sfc_n, c.veg2atm_n, c.atm2veg_n
+        change = dict.fromkeys(reservoirs, 0.)
+        change['atmosphere'] += (f['rivr2atm'] + f['volc'] + f['land_use'] + f['fossil_fuel'] + f['cement']
+                                 + f['sfc2atm'] - f['atm2sfc'] + f['veg2atm'] - f['atm2veg'] - f['atm2rivr'])
+        change['fuel_reserves'] -= f['fossil_fuel']
+        change['vegetation'] += f['atm2veg'] - f['veg2atm'] - f['veg2soil'] - f['land_use']
+        change['soil'] += f['veg2soil'] - f['soil2rivr']
+        change['surface_ocean'] += (f['rvr2sea'] - f['sfc2bio'] + f['bio2sfc'] - f['sfc2deep'] + f['deep2sfc']
+                                    - f['sfc2atm'] + f['atm2sfc'])
+        change['marine_biota'] += f['sfc2bio'] - f['bio2sfc'] - f['bio2doc'] - f['bio2deep']
+        change['dissolved_organic'] += f['bio2doc'] - f['doc2deep']
+        change['deep_ocean'] += f['doc2deep'] + f['bio2deep'] + f['sfc2deep'] - f['deep2sfc'] - f['deep2rock']
+        state[ii] = state[ii-1] + np.array([change[name] for name in reservoirs])
+    return state, f
+
+@pytest.mark.parametrize('switches', list(product((True, False), repeat=6)))
+def test_flux_table_matches_branches(switches):
+    # 500 years: long enough for the fossil fuel to run out
+    result = run_model(switches[0], 500, *switches[1:])
+    state, fluxes = branch_model(switches[0], 500, *switches[1:])
+    np.testing.assert_allclose(np.array(result[:-1]).T, state, rtol=1e-12, atol=1e-9)
+    for name, value in fluxes.items():
+        assert result.fluxes[name] == pytest.approx(value, rel=1e-12, abs=1e-9), name
+
+@pytest.mark.parametrize('years', [[-1, 5], [5, 10], [2.5]])
+def test_ensemble_rejects_years_outside_the_run(years):
+    with pytest.raises(ValueError):
+        c.run_ensemble(10, years=years, humans=[True, False])
+
+@pytest.mark.parametrize('switches', [(True,) + (False,)*5, (True,)*6, (False,)*6])
+def test_trbdf2_takes_few_steps_over_long_runs(switches):
+    # the default for a million years: a few hundred steps, and in the first
+    # thousand years as close to a tightly-held rk45 as the tolerance asks
+    years = [100, 395, 1000]
+    exact = c.integrate_model(years, 'rk45', *switches, rtol=1e-11, atol=1e-11)
+    result = c.integrate_model(years + [1e6], None, *switches)
+    assert result.n_steps + result.n_rejected < 500
+    state, expected = np.array(result[:len(reservoirs)])[:, :3], np.array(exact[:len(reservoirs)])
+    np.testing.assert_allclose(state, expected, rtol=2e-5, atol=1e-3)
+
+@pytest.mark.parametrize('switches', list(product((True, False), repeat=6)))
+def test_solve_model_matches_run_model(switches):
+    years = np.arange(3000)
+    stepped = run_model(switches[0], len(years), *switches[1:])
+    solved = c.solve_model(years, *switches)
+    exact = np.array(stepped[:-1])
+    np.testing.assert_allclose(np.array(solved[:-1]), exact, rtol=0., atol=1e-9*np.abs(exact).max())
+    for name, value in stepped.fluxes.items():
+        assert solved.fluxes[name] == pytest.approx(value, rel=1e-9, abs=1e-9), name
+
+@pytest.mark.parametrize('n_iterations', [1000, 5000])
+def test_float32_ensemble_within_bounds(n_iterations):
+    # every scenario, relative to each reservoir's largest value and to the largest flux
+    members = dict(zip(c.switch_defaults, np.array(list(product((True, False), repeat=6))).T))
+    exact = c.run_ensemble(n_iterations, percentiles=(), **members)
+    single = c.run_ensemble(n_iterations, percentiles=(), dtype=np.float32, **members)
+    allowed = {name: rtol*n_iterations/1000. for name, rtol in c.float32_rtol.items()}
+    scale = np.abs(exact.state).max(axis=1, keepdims=True)
+    assert np.max(np.abs(single.state - exact.state)/np.where(scale > 0, scale, 1.)) <= allowed['state']
+    exact_fluxes, single_fluxes = np.array(list(exact.fluxes.values())), np.array(list(single.fluxes.values()))
+    assert np.max(np.abs(single_fluxes - exact_fluxes))/np.abs(exact_fluxes).max() <= allowed['fluxes']
+
+def measure_ensemble(**kwargs):
+    # (peak bytes traced, the run's own bytes_per_member)
+    c.run_ensemble(**dict(kwargs, n_iterations=3, years=None, percentiles=()))
+    tracemalloc.start()
+    result = c.run_ensemble(**kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, result.bytes_per_member
+
+@pytest.mark.parametrize('years, percentiles', [(None, ()), (None, (5, 50, 95)), ([499], ())])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+@pytest.mark.parametrize('constants', [False, True])
+def test_ensemble_bytes_per_member(years, percentiles, dtype, constants):
+    n_members = 10000
+    members = dict(humans=np.arange(n_members) % 2)
+    if constants:
+        members['atmosphere_a_0'] = np.linspace(700., 900., n_members)
+    peak, bytes_per_member = measure_ensemble(n_iterations=500, years=years, percentiles=percentiles,
+                                              dtype=dtype, **members)
+    assert 0.9 < bytes_per_member*n_members/peak < 1.3
+
+def test_float32_halves_the_last_year_only_peak():
+    members = dict(humans=np.arange(10000) % 2, atmosphere_a_0=np.linspace(700., 900., 10000))
+    double, _ = measure_ensemble(n_iterations=500, years=[499], percentiles=(), **members)
+    single, _ = measure_ensemble(n_iterations=500, years=[499], percentiles=(), dtype=np.float32, **members)
+    assert single < 0.6*double
@@ -0,0 +1,36 @@
+# the numba kernels against the numpy code. without numba the kernels run
+# uncompiled, which is slow but checks the same code.
+from itertools import product
+import numpy as np
+import pytest
+import kernels
+import atmos_core
+import carbon_core
+
+def run_both(monkeypatch, run):
+    results = []
+    for name in kernels.backend_names:
+        monkeypatch.setattr(kernels, 'backend', name)
+        results.append(run())
+    return results
+
+def assert_close(reference, other, rtol=1e-9):
+    # relative to the largest value, so zeros and tiny fluxes don't count for more
+    reference, other = np.asarray(reference, dtype=float), np.asarray(other, dtype=float)
+    scale = max(np.max(np.abs(reference), initial=0.), 1e-300)
+    np.testing.assert_allclose(other, reference, rtol=0., atol=rtol*scale)
+
+@pytest.mark.parametrize('n_layers, emiss_atm', list(product([0, 1, 2, 5, 25], [0.1, 0.5, 1.])))
+def test_atmos_backends_agree(monkeypatch, n_layers, emiss_atm):
+    numpy_result, numba_result = run_both(monkeypatch, lambda: atmos_core.integrate_atmos_model(
+        0.3, 1.36e3/4., emiss_atm, n_layers, n_steps=2000))
+    for field in ('t_surf', 't_atm', 'heat_upward', 'heat_dnward'):
+        assert_close(getattr(numpy_result, field), getattr(numba_result, field))
+    assert numpy_result.iterations == numba_result.iterations
+
+@pytest.mark.parametrize('switches', list(product((True, False), repeat=6)))
+def test_carbon_backends_agree(monkeypatch, switches):
+    # 500 years, so the fossil fuel runs out and its flux leaves its limit
+    numpy_result, numba_result = run_both(monkeypatch, lambda: carbon_core.run_model(switches[0], 500, *switches[1:]))
+    assert_close(np.array(numpy_result[:-1]), np.array(numba_result[:-1]))
+    assert_close(list(numpy_result.fluxes.values()), list(numba_result.fluxes.values()))
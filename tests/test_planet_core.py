@@ -0,0 +1,27 @@
+import numpy as np
+from planet_core import load_catalog, stream_catalog, evaluate_catalog
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+def test_blank_cells_are_nan(tmp_path):
+    filename = write(tmp_path / 'catalog.csv', 'name,distance,t_obs,albedo\nA,1,300,0.3\nB,2,,\nC,3,250,0.1\n')
+    catalog = load_catalog(filename)
+    assert catalog['t_obs'].dtype == float
+    np.testing.assert_array_equal(np.isnan(catalog['t_obs']), [False, True, False])
+    np.testing.assert_array_equal(np.isnan(catalog['albedo']), [False, True, False])
+    result = evaluate_catalog(catalog)
+    assert np.isnan(result['residual'][1])
+    assert np.all(np.isfinite(result['residual'][[0, 2]]))
+
+def test_chunk_without_observations(tmp_path):
+    # the second chunk has no t_obs at all: its residuals are nan, not t_model
+    filename = write(tmp_path / 'catalog.csv', 'name,distance,t_obs\nA,1,300\nB,2,250\nC,3,\nD,4,\n')
+    chunks = list(stream_catalog(filename, chunk_rows=2))
+    assert len(chunks) == 2
+    for chunk, result in chunks:
+        assert chunk['t_obs'].dtype == float
+    assert np.all(np.isfinite(chunks[0][1]['residual']))
+    assert np.all(np.isnan(chunks[1][1]['residual']))
+    np.testing.assert_array_equal(chunks[1][0]['name'], ['C', 'D'])